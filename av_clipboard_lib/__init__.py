@@ -1,12 +1,43 @@
 from av_clipboard_lib import clipboard_data
+from av_clipboard_lib import analytics
 from av_clipboard_lib import av_objects
 from av_clipboard_lib import base85
+from av_clipboard_lib import batch
+from av_clipboard_lib import checked_decoding
+from av_clipboard_lib import chord_copy
+from av_clipboard_lib import columnar_file
+from av_clipboard_lib import containers
+from av_clipboard_lib import diff
+from av_clipboard_lib import instrumentation
+from av_clipboard_lib import note_array
+from av_clipboard_lib import parse_cache
+from av_clipboard_lib import pattern_index
+from av_clipboard_lib import structure_array
+from av_clipboard_lib import timing
+from av_clipboard_lib import transforms
+from av_clipboard_lib import validation
 from av_clipboard_lib import varint
 
-from av_clipboard_lib.clipboard_data import parse_av_clipboard_data, produce_av_clipboard_data
+from av_clipboard_lib.clipboard_data import iter_av_clipboard_objects, parse_av_clipboard_chords, \
+    parse_av_clipboard_data, parse_av_clipboard_data_chunked, parse_av_clipboard_notes, produce_av_clipboard_data, \
+    write_av_clipboard_data
 from av_clipboard_lib.av_objects import (
     Tap, Hold, Mine, Roll, Lift, Fake,
     BPM, Stop, Delay, Warp, TimeSignature, Ticks, Combo,
     Speed, Scroll, FakeSegment, Label
 )
+from av_clipboard_lib.analytics import ChartReport, chart_report
 from av_clipboard_lib.base_types import RowPosition, TimePosition
+from av_clipboard_lib.batch import BatchResult, parse_many, produce_many
+from av_clipboard_lib.checked_decoding import ClipboardDecodeError
+from av_clipboard_lib.chord_copy import ChordCopy
+from av_clipboard_lib.columnar_file import dumps_columnar, load_columnar, loads_columnar, save_columnar
+from av_clipboard_lib.containers import SortedObjects
+from av_clipboard_lib.diff import Patch, apply_patch, diff_copies
+from av_clipboard_lib.instrumentation import Instrumentation
+from av_clipboard_lib.note_array import NoteArray
+from av_clipboard_lib.parse_cache import ParseCache
+from av_clipboard_lib.pattern_index import ChordIndex
+from av_clipboard_lib.structure_array import StructureArray
+from av_clipboard_lib.timing import TimingMap
+from av_clipboard_lib.validation import NoteIssue, check_notes, find_note_issues
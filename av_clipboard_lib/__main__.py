@@ -0,0 +1,7 @@
+import sys
+
+from av_clipboard_lib.cli import main
+
+# Worker processes started by spawning import this module again, they must not run the command.
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""Density and chord statistics of the notes of a copy.
+
+Everything works on the chords of a `ChordIndex`, so mines and fakes are not counted.
+Positions are in seconds for time copies and for row copies given their timing, otherwise they are in rows.
+"""
+from array import array
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple, Union
+
+from attr import attrs
+
+from av_clipboard_lib.clipboard_data import RowCopy, StructureCopy, TimeCopy
+from av_clipboard_lib.note_array import NoteArray, _UNSTEPPED_KINDS
+from av_clipboard_lib.pattern_index import ChordIndex
+from av_clipboard_lib.timing import ROWS_PER_BEAT, TimingMap
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+Timing = Union[StructureCopy, TimingMap]
+
+# Chord bitmasks fit in a QWORD up to this many columns, which lets NumPy group the notes.
+_NUMPY_COLUMNS = 64
+
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+@attrs(auto_attribs=True, slots=True)
+class Chords:
+    """Sorted chord `positions`, with the number of columns stepped on and the column bitmask of each chord.
+
+    `masks` is a QWORD array when NumPy grouped the notes, a list otherwise.
+    """
+    in_seconds: bool
+    positions: array
+    sizes: array
+    masks: Sequence[int]
+
+    def __len__(self):
+        return len(self.masks)
+
+    @classmethod
+    def of(cls, notes: Union[RowCopy, TimeCopy, NoteArray, ChordIndex], timing: Timing = None):
+        """Group `notes` into chords, converting rows to seconds when `timing` is given."""
+        if isinstance(notes, (RowCopy, TimeCopy)):
+            notes = notes.to_note_array()
+
+        if numpy is not None and isinstance(notes, NoteArray) and _fits_numpy(notes):
+            is_time, positions, sizes, masks = _group_numpy(notes)
+        else:
+            index = notes
+            if not isinstance(index, ChordIndex):
+                index = ChordIndex.from_notes(notes)
+            is_time, positions, masks = index.is_time, array('d', index.positions), index.masks
+            sizes = array('I', map(_popcount, masks))
+
+        if timing is not None and not is_time:
+            if isinstance(timing, StructureCopy):
+                timing = TimingMap.from_structure_copy(timing)
+            positions, is_time = array('d', timing.rows_to_seconds(positions)), True
+
+        return cls(is_time, positions, sizes, masks)
+
+
+def _fits_numpy(notes: NoteArray) -> bool:
+    return not len(notes) or numpy.frombuffer(notes.columns, dtype=numpy.uint8).max() < _NUMPY_COLUMNS
+
+
+def _array_of(typecode: str, values) -> array:
+    result = array(typecode)
+    result.frombytes(values.tobytes())
+    return result
+
+
+def _group_numpy(notes: NoteArray):
+    """Same grouping as `ChordIndex.from_notes`, done by NumPy."""
+    kinds = numpy.frombuffer(notes.kinds, dtype=numpy.uint8)
+    starts = numpy.frombuffer(notes.starts, dtype=notes.is_time and numpy.float64 or numpy.uint64)
+    columns = numpy.frombuffer(notes.columns, dtype=numpy.uint8)
+
+    stepped = ~numpy.isin(kinds, [*_UNSTEPPED_KINDS])
+    starts, columns = starts[stepped], columns[stepped]
+    if not len(starts):
+        return notes.is_time, array('d'), array('I'), array('Q')
+
+    order = numpy.lexsort((columns, starts))
+    starts, columns = starts[order], columns[order]
+    # A chord counts the columns it steps on, like the popcount of its mask: notes sharing a column count once.
+    distinct = numpy.concatenate(([True], (starts[1:] != starts[:-1]) | (columns[1:] != columns[:-1])))
+    starts, bits = starts[distinct], numpy.left_shift(numpy.uint64(1), columns[distinct].astype(numpy.uint64))
+    firsts = numpy.flatnonzero(numpy.concatenate(([True], starts[1:] != starts[:-1])))
+
+    positions = _array_of('d', starts[firsts].astype(numpy.float64))
+    sizes = _array_of('I', numpy.diff(numpy.append(firsts, len(starts))).astype(numpy.uint32))
+    return notes.is_time, positions, sizes, _array_of('Q', numpy.bitwise_or.reduceat(bits, firsts))
+
+
+def _window_counts_numpy(chords: Chords, window: float):
+    starts = numpy.frombuffer(chords.positions, dtype=numpy.float64)
+    sizes = numpy.frombuffer(chords.sizes, dtype=numpy.uint32)
+    prefix = numpy.concatenate(([0], numpy.cumsum(sizes, dtype=numpy.int64)))
+    ends = numpy.searchsorted(starts, starts + window, side='left')
+    return prefix[ends] - prefix[:len(starts)]
+
+
+def window_counts(chords: Chords, window: float) -> List[int]:
+    """Number of notes within `window` from the start of each chord, that chord included."""
+    if numpy is not None:
+        return _window_counts_numpy(chords, window).tolist()
+
+    positions, sizes = chords.positions, chords.sizes
+
+    prefix = [0]
+    for size in sizes:
+        prefix.append(prefix[-1] + size)
+
+    counts = []
+    end = 0
+    for start, position in enumerate(positions):
+        # Two pointers: the end of the window only ever moves forward.
+        limit = position + window
+        end = max(end, start)
+        while end < len(positions) and positions[end] < limit:
+            end += 1
+        counts.append(prefix[end] - prefix[start])
+    return counts
+
+
+def peak_density(chords: Chords, window: float) -> Tuple[int, float]:
+    """Highest number of notes within `window`, and the position of the first chord of that window."""
+    if not len(chords):
+        return 0, 0.0
+
+    if numpy is not None:
+        counts = _window_counts_numpy(chords, window)
+        best = int(counts.argmax())
+        return int(counts[best]), chords.positions[best]
+
+    counts = window_counts(chords, window)
+    best = max(range(len(counts)), key=counts.__getitem__)
+    return counts[best], chords.positions[best]
+
+
+def density_curve(chords: Chords, bucket: float = 1.0) -> List[int]:
+    """Number of notes in each `bucket` long slice from position zero, notes per second for time positions."""
+    if not len(chords):
+        return []
+
+    positions = chords.positions
+    if numpy is not None:
+        slices = numpy.maximum(numpy.frombuffer(positions, dtype=numpy.float64) // bucket, 0).astype(numpy.int64)
+        weights = numpy.frombuffer(chords.sizes, dtype=numpy.uint32)
+        return numpy.bincount(slices, weights=weights).astype(numpy.int64).tolist()
+
+    curve = [0] * (max(int(positions[-1] // bucket), 0) + 1)
+    for position, size in zip(positions, chords.sizes):
+        curve[max(int(position // bucket), 0)] += size
+    return curve
+
+
+def _masks_numpy(chords: Chords):
+    """The masks of `chords` as a NumPy array, or None if NumPy is missing or they do not fit."""
+    if numpy is None:
+        return None
+    if isinstance(chords.masks, array):
+        return numpy.frombuffer(chords.masks, dtype=numpy.uint64)
+    if max(chords.masks, default=0).bit_length() > _NUMPY_COLUMNS:
+        return None
+    return numpy.array(chords.masks, dtype=numpy.uint64)
+
+
+def column_gaps(chords: Chords) -> Dict[int, List[float]]:
+    """Distances between consecutive notes of each column."""
+    masks = _masks_numpy(chords)
+    if masks is not None:
+        positions = numpy.frombuffer(chords.positions, dtype=numpy.float64)
+        gaps = {}
+        for column in range(int(numpy.bitwise_or.reduce(masks, initial=0)).bit_length()):
+            column_positions = positions[masks & numpy.uint64(1 << column) != 0]
+            if len(column_positions) > 1:
+                gaps[column] = numpy.diff(column_positions).tolist()
+        return gaps
+
+    last = {}
+    gaps = {}
+    for position, mask in zip(chords.positions, chords.masks):
+        column = 0
+        while mask:
+            if mask & 1:
+                previous = last.get(column)
+                if previous is not None:
+                    gaps.setdefault(column, []).append(position - previous)
+                last[column] = position
+            mask >>= 1
+            column += 1
+    return gaps
+
+
+def count_jacks(chords: Chords) -> int:
+    """Number of chords sharing a column with the previous chord."""
+    masks = _masks_numpy(chords)
+    if masks is not None:
+        return int(numpy.count_nonzero(masks[:-1] & masks[1:]))
+
+    masks = chords.masks
+    return sum(1 for index in range(1, len(masks)) if masks[index - 1] & masks[index])
+
+
+def stream_lengths(chords: Chords) -> List[int]:
+    """Lengths of the runs of evenly spaced single notes that never repeat a column."""
+    masks = _masks_numpy(chords)
+    if masks is not None:
+        return _stream_lengths_numpy(chords, masks)
+
+    positions, sizes, masks = chords.positions, chords.sizes, chords.masks
+    runs = []
+    length = 0
+    for index in range(len(masks)):
+        if sizes[index] != 1:
+            if length:
+                runs.append(length)
+            length = 0
+            continue
+
+        continues = length and not masks[index - 1] & masks[index] and (
+            length == 1 or _even(positions[index - 2], positions[index - 1], positions[index])
+        )
+        if continues:
+            length += 1
+            continue
+
+        if length:
+            runs.append(length)
+        length = 1
+
+    if length:
+        runs.append(length)
+    return runs
+
+
+def _even(first: float, second: float, third: float) -> bool:
+    return abs((third - second) - (second - first)) <= 1e-9 * max(1.0, abs(third))
+
+
+def _stream_lengths_numpy(chords: Chords, masks) -> List[int]:
+    count = len(masks)
+    if count == 0:
+        return []
+
+    positions = numpy.frombuffer(chords.positions, dtype=numpy.float64)
+    single = numpy.frombuffer(chords.sizes, dtype=numpy.uint32) == 1
+    linked = numpy.zeros(count, dtype=bool)
+    linked[1:] = single[1:] & single[:-1] & (masks[1:] & masks[:-1] == 0)
+    even = numpy.zeros(count, dtype=bool)
+    gaps = numpy.diff(positions)
+    even[2:] = numpy.abs(gaps[1:] - gaps[:-1]) <= 1e-9 * numpy.maximum(1.0, numpy.abs(positions[2:]))
+
+    # A linked note continues the run if evenly spaced, or if it is only the second note of the run,
+    # so an uneven one continues exactly when the note before it does not. Along a block of uneven notes
+    # the answer alternates, starting from the opposite of the note right before the block.
+    continues = linked & even
+    uneven = linked & ~even
+    indices = numpy.arange(count)
+    block_starts = numpy.maximum.accumulate(numpy.where(uneven & ~numpy.roll(uneven, 1), indices, 0))
+    alternating = ~continues[block_starts - 1] ^ ((indices - block_starts) % 2 == 1)
+    continues[uneven] = alternating[uneven]
+
+    starts = numpy.flatnonzero(~continues)
+    lengths = numpy.diff(numpy.append(starts, count))
+    return lengths[single[starts]].tolist()
+
+
+def chord_histogram(chords: Chords) -> Dict[int, int]:
+    """Number of chords of each size, by size."""
+    if numpy is not None:
+        counts = numpy.bincount(numpy.frombuffer(chords.sizes, dtype=numpy.uint32))
+        return {size: int(counts[size]) for size in numpy.flatnonzero(counts).tolist()}
+    return dict(sorted(Counter(chords.sizes).items()))
+
+
+@attrs(auto_attribs=True, slots=True, frozen=True)
+class ChartReport:
+    """Summary of `chart_report`, densities are notes per `window` at `window` long stretches.
+
+    `chord_sizes` holds the `chord_histogram` as `(size, count)` pairs by size, so that reports are hashable.
+    """
+    in_seconds: bool
+    note_count: int
+    chord_count: int
+    duration: float
+    window: float
+    average_density: float
+    peak_density: int
+    peak_position: float
+    chord_sizes: Tuple[Tuple[int, int], ...]
+    jacks: int
+    streams: int
+    longest_stream: int
+
+
+def chart_report(notes: Union[RowCopy, TimeCopy, NoteArray, ChordIndex], timing: Timing = None,
+                 window: float = None, min_stream: int = 8) -> ChartReport:
+    """Compute the statistics of `notes` in one go.
+
+    `window` defaults to a second, or to a beat when positions are rows.
+    A stream is a run of at least `min_stream` single notes, see `stream_lengths`.
+    """
+    chords = Chords.of(notes, timing)
+    if window is None:
+        window = chords.in_seconds and 1.0 or ROWS_PER_BEAT
+
+    note_count = sum(chords.sizes)
+    duration = len(chords) and chords.positions[-1] - chords.positions[0] or 0.0
+    peak, peak_position = peak_density(chords, window)
+    streams = [length for length in stream_lengths(chords) if length >= min_stream]
+
+    return ChartReport(
+        in_seconds=chords.in_seconds,
+        note_count=note_count,
+        chord_count=len(chords),
+        duration=duration,
+        window=window,
+        average_density=duration and note_count * window / duration or float(note_count),
+        peak_density=peak,
+        peak_position=peak_position,
+        chord_sizes=tuple(chord_histogram(chords).items()),
+        jacks=count_jacks(chords),
+        streams=len(streams),
+        longest_stream=max(streams, default=0),
+    )
@@ -1,12 +1,15 @@
 from io import BytesIO
-from itertools import chain
-from typing import Union
+from operator import attrgetter
+from struct import Struct
+from typing import List, Tuple, Union
 
-from attr import attrs
+from attr import attrib, attrs, setters
 
-from av_clipboard_lib.base_types import PositionValue, RowPosition, STRUCT_BYTE, STRUCT_CHAR, STRUCT_DOUBLE, \
-    STRUCT_DWORD, TimePosition
-from av_clipboard_lib.varint import decode_next_varint, encode_varint
+from av_clipboard_lib.base_types import PositionValue, RowPosition, STRUCT_BYTE, TimePosition, decode_from_stream, \
+    decode_via_buffer
+from av_clipboard_lib.checked_decoding import ClipboardDecodeError, decode_group_checked, decode_labels_checked, \
+    decode_row_checked, decode_time_checked
+from av_clipboard_lib.varint import decode_varint_from, encode_varint
 
 
 def _register_to(registry):
@@ -14,6 +17,7 @@ def _register_to(registry):
         def _(cls):
             registry[kind] = cls
             registry[cls] = kind
+            cls.KIND = kind
             return cls
 
         return _
@@ -21,6 +25,27 @@ def _register_to(registry):
     return register
 
 
+_edit_stamp = 0
+
+
+def edit_stamp() -> int:
+    """Count of attribute assignments on notes and structures so far, used to tell if a sorted order still holds"""
+    return _edit_stamp
+
+
+def _count_edit(instance, attribute, value):
+    global _edit_stamp
+    _edit_stamp += 1
+    return value
+
+
+def _forget_encoded(instance, attribute, value):
+    value = _count_edit(instance, attribute, value)
+    instance._encoded = None
+    instance._edited_at = _edit_stamp
+    return value
+
+
 NOTE_REGISTRY = {}
 STRUCTURE_REGISTRY = {}
 
@@ -28,10 +53,13 @@ _register_note = _register_to(NOTE_REGISTRY)
 _register_structure = _register_to(STRUCTURE_REGISTRY)
 
 
-@attrs(auto_attribs=True)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_forget_encoded)
 class InstantNote:
     column: int
     position: PositionValue
+    _encoded: bytes = attrib(default=None, init=False, eq=False, repr=False, on_setattr=setters.NO_OP)
+    # Stamp of the last edit, so that a list of notes known to be sorted only checks the edited ones again.
+    _edited_at: int = attrib(default=0, init=False, eq=False, repr=False, on_setattr=setters.NO_OP)
 
     @classmethod
     def from_triplet(cls, column, first, _):
@@ -44,6 +72,13 @@ class InstantNote:
 
     @property
     def encoded(self):
+        """Encoded note, kept until one of its attributes is set again"""
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = self._encode()
+        return encoded
+
+    def _encode(self):
         return b''.join((
             STRUCT_BYTE.pack(self.column | 0x80),
             self.position.encoded,
@@ -52,11 +87,14 @@ class InstantNote:
         ))
 
 
-@attrs(auto_attribs=True)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_forget_encoded)
 class LongNote:
     column: int
     start_position: PositionValue
     end_position: PositionValue
+    _encoded: bytes = attrib(default=None, init=False, eq=False, repr=False, on_setattr=setters.NO_OP)
+    # Stamp of the last edit, so that a list of notes known to be sorted only checks the edited ones again.
+    _edited_at: int = attrib(default=0, init=False, eq=False, repr=False, on_setattr=setters.NO_OP)
 
     @classmethod
     def from_triplet(cls, column, first, second):
@@ -69,6 +107,13 @@ class LongNote:
 
     @property
     def encoded(self):
+        """Encoded note, kept until one of its attributes is set again"""
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = self._encode()
+        return encoded
+
+    def _encode(self):
         return b''.join((
             STRUCT_BYTE.pack(self.column | 0x80),
             self.start_position.encoded,
@@ -79,8 +124,9 @@ class LongNote:
 
 @_register_note(None)
 class Tap(InstantNote):
-    @property
-    def encoded(self):
+    __slots__ = ()
+
+    def _encode(self):
         return b''.join((
             STRUCT_BYTE.pack(self.column),
             self.position.encoded,
@@ -88,173 +134,190 @@ class Tap(InstantNote):
 
 
 @_register_note(0x00)
-class Hold(LongNote): pass
+class Hold(LongNote):
+    __slots__ = ()
 
 
 @_register_note(0x01)
-class Mine(InstantNote): pass
+class Mine(InstantNote):
+    __slots__ = ()
 
 
 @_register_note(0x02)
-class Roll(LongNote): pass
+class Roll(LongNote):
+    __slots__ = ()
 
 
 @_register_note(0x03)
-class Lift(InstantNote): pass
+class Lift(InstantNote):
+    __slots__ = ()
 
 
 @_register_note(0x04)
-class Fake(InstantNote): pass
+class Fake(InstantNote):
+    __slots__ = ()
+
 
+def compile_structure_codec(fmt: str, *names: str):
+    """Give a fixed-size structure class its codec, built on one `Struct(fmt)` for the whole record.
+
+    The record is the row of the structure followed by the fields in `names`.
+    """
+    packer = Struct(fmt)
+    size = packer.size
+    get_values = attrgetter('position.row', *names)
 
-def generate_structure_serializer_pair(order, packers):
     @classmethod
-    def decode(cls, stream: BytesIO):
-        row = RowPosition.decode_next_as_dword(stream)
-        data = {
-            name: packer.unpack(stream.read(packer.size))[0]
-            for name, packer in zip(order, packers)
-        }
+    def decode_from(cls, buffer, offset: int):
+        row, *values = packer.unpack_from(buffer, offset)
+        return cls(RowPosition.of(row), *values), offset + size
 
-        return cls(row, **data)
+    @classmethod
+    def decode_group_from(cls, buffer, offset: int, count: int):
+        end = offset + count * size
+        return [
+            cls(RowPosition.of(row), *values)
+            for row, *values in packer.iter_unpack(buffer[offset:end])
+        ], end
 
     @property
     def encoded(self):
-        return b''.join((
-            self.position.encoded_as_dword,
-            *(
-                packer.pack(getattr(self, name))
-                for name, packer in zip(order, packers)
-            )
-        ))
-
-    return decode, encoded
-
-
-@attrs(auto_attribs=True)
+        return packer.pack(*get_values(self))
+
+    def pack_into(self, buffer, offset: int) -> int:
+        packer.pack_into(buffer, offset, *get_values(self))
+        return offset + size
+
+    @staticmethod
+    def encode_group(objects) -> bytes:
+        buffer = bytearray(len(objects) * size)
+        offset = 0
+        for datum in objects:
+            offset = datum.pack_into(buffer, offset)
+        return bytes(buffer)
+
+    def decorate(cls):
+        cls.STRUCT = packer
+        cls.FIELDS = names
+        cls.FIELD_CODES = fmt[2:]
+        cls.decode = decode_via_buffer
+        cls.decode_from = decode_from
+        cls.decode_group_from = decode_group_from
+        cls.encoded = encoded
+        cls.pack_into = pack_into
+        cls.encode_group = encode_group
+        return cls
+
+    return decorate
+
+
+@compile_structure_codec('<Id', 'bpm')
 @_register_structure(0x00)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class BPM:
     position: RowPosition
     bpm: float
 
-    decode, encoded = generate_structure_serializer_pair(['bpm'], [STRUCT_DOUBLE])
-
 
-@attrs(auto_attribs=True)
+@compile_structure_codec('<Id', 'time')
 @_register_structure(0x01)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Stop:
     position: RowPosition
     time: float
 
-    decode, encoded = generate_structure_serializer_pair(['time'], [STRUCT_DOUBLE])
-
 
-@attrs(auto_attribs=True)
+@compile_structure_codec('<Id', 'time')
 @_register_structure(0x02)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Delay:
     position: RowPosition
     time: float
 
-    decode, encoded = generate_structure_serializer_pair(['time'], [STRUCT_DOUBLE])
 
-
-@attrs(auto_attribs=True)
+@compile_structure_codec('<II', 'skipped_rows')
 @_register_structure(0x03)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Warp:
     position: RowPosition
     skipped_rows: int
 
-    decode, encoded = generate_structure_serializer_pair(['skipped_rows'], [STRUCT_DWORD])
-
 
-@attrs(auto_attribs=True)
+@compile_structure_codec('<III', 'numerator', 'denominator')
 @_register_structure(0x04)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class TimeSignature:
     position: RowPosition
     numerator: int
     denominator: int
 
-    decode, encoded = generate_structure_serializer_pair(['numerator', 'denominator'], [STRUCT_DWORD] * 2)
-
 
-@attrs(auto_attribs=True)
+@compile_structure_codec('<II', 'ticks')
 @_register_structure(0x05)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Ticks:
     position: RowPosition
     ticks: int
 
-    decode, encoded = generate_structure_serializer_pair(['ticks'], [STRUCT_DWORD])
 
-
-@attrs(auto_attribs=True)
+@compile_structure_codec('<III', 'combo_mul', 'miss_mul')
 @_register_structure(0x06)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Combo:
     position: RowPosition
     combo_mul: int
     miss_mul: int
 
-    decode, encoded = generate_structure_serializer_pair(['combo_mul', 'miss_mul'], [STRUCT_DWORD] * 2)
-
 
-@attrs(auto_attribs=True)
+@compile_structure_codec('<IddI', 'ratio', 'delay', 'delay_is_time')
 @_register_structure(0x07)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Speed:
     position: RowPosition
     ratio: float
     delay: float
-    delay_is_time: bool
-
-    @classmethod
-    def decode(cls, stream: BytesIO):
-        row = RowPosition.decode_next_as_dword(stream)
-        ratio, = STRUCT_DOUBLE.unpack(stream.read(8))
-        delay, = STRUCT_DOUBLE.unpack(stream.read(8))
-        is_time, = STRUCT_DWORD.unpack(stream.read(4))
-
-        return cls(row, ratio, delay, bool(is_time))
-
-    @property
-    def encoded(self):
-        return b''.join((
-            self.position.encoded_as_dword,
-            STRUCT_DOUBLE.pack(self.ratio),
-            STRUCT_DOUBLE.pack(self.delay),
-            STRUCT_DWORD.pack(int(self.delay_is_time))
-        ))
+    delay_is_time: bool = attrib(converter=bool)
 
 
-@attrs(auto_attribs=True)
+@compile_structure_codec('<Id', 'ratio')
 @_register_structure(0x08)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Scroll:
     position: RowPosition
     ratio: float
 
-    decode, encoded = generate_structure_serializer_pair(['ratio'], [STRUCT_DOUBLE])
 
-
-@attrs(auto_attribs=True)
+@compile_structure_codec('<II', 'fake_rows_amt')
 @_register_structure(0x09)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class FakeSegment:
     position: RowPosition
     fake_rows_amt: int
 
-    decode, encoded = generate_structure_serializer_pair(['fake_rows_amt'], [STRUCT_DWORD])
-
 
-@attrs(auto_attribs=True)
 @_register_structure(0x0A)
+@attrs(auto_attribs=True, slots=True, weakref_slot=False, on_setattr=_count_edit)
 class Label:
     position: RowPosition
     message: str
 
+    decode = decode_via_buffer
+
     @classmethod
-    def decode(cls, stream: BytesIO):
-        row = RowPosition.decode_next_as_dword(stream)
-        message_len = decode_next_varint(stream)
-        unpacked_message = STRUCT_CHAR.iter_unpack(stream.read(message_len))
-        message = b''.join(chain.from_iterable(unpacked_message)).decode('ascii')
+    def decode_from(cls, buffer, offset: int):
+        row, offset = RowPosition.decode_from_as_dword(buffer, offset)
+        message_len, offset = decode_varint_from(buffer, offset)
+        message = bytes(buffer[offset:offset + message_len]).decode('ascii')
 
-        return cls(row, message)
+        return cls(row, message), offset + len(message)
+
+    @classmethod
+    def decode_group_from(cls, buffer, offset: int, count: int):
+        objects = []
+        for _ in range(count):
+            label, offset = cls.decode_from(buffer, offset)
+            objects.append(label)
+        return objects, offset
 
     @property
     def encoded(self):
@@ -264,24 +327,74 @@ class Label:
             self.message.encode('ascii')
         ))
 
+    @staticmethod
+    def encode_group(objects) -> bytes:
+        return b''.join(datum.encoded for datum in objects)
+
 
 NoteType = Union[Tap, Hold, Mine, Roll, Lift, Fake]
 StructureType = Union[BPM, Stop, Delay, Warp, TimeSignature, Ticks, Combo, Speed, Scroll, FakeSegment, Label]
 
 
 def decode_next_note(stream: BytesIO, is_time: bool) -> NoteType:
-    first_byte, = STRUCT_BYTE.unpack(stream.read(1))
-    first_position = is_time and TimePosition.decode_next(stream) or RowPosition.decode_next_as_varint(stream)
+    return decode_from_stream(stream, decode_note_from, is_time)
+
+
+def decode_note_from(buffer, offset: int, is_time: bool, strict: bool = False) -> Tuple[NoteType, int]:
+    """Decode the note at `offset` in `buffer`, return it and the offset right after it.
+
+    With `strict`, positions, kinds and the order of long note positions are checked as the note is decoded,
+    see `checked_decoding`; the copy decoders turn running out of bytes into `ClipboardDecodeError`.
+    """
+    note_start = offset
+    first_byte = buffer[offset]
+    if strict:
+        decode_position = is_time and decode_time_checked or decode_row_checked
+    else:
+        decode_position = is_time and TimePosition.decode_from or RowPosition.decode_from_as_varint
+    first_position, offset = decode_position(buffer, offset + 1)
 
     if not first_byte & 0x80:
-        return NOTE_REGISTRY[None](first_byte, first_position)
+        return NOTE_REGISTRY[None](first_byte, first_position), offset
 
     column = first_byte ^ 0x80
-    second_position = is_time and TimePosition.decode_next(stream) or RowPosition.decode_next_as_varint(stream)
-    kind, = STRUCT_BYTE.unpack(stream.read(1))
-
-    return NOTE_REGISTRY[kind].from_triplet(column, first_position, second_position)
+    second_position, offset = decode_position(buffer, offset)
+    kind = buffer[offset]
+    if not strict:
+        return NOTE_REGISTRY[kind].from_triplet(column, first_position, second_position), offset + 1
+
+    cls = NOTE_REGISTRY.get(kind)
+    if cls is None:
+        raise ClipboardDecodeError(f'Unknown note kind {kind}', offset)
+    # Comparing the values directly skips the ordering methods of positions.
+    if issubclass(cls, LongNote) and (
+            second_position.seconds < first_position.seconds if is_time else second_position.row < first_position.row
+    ):
+        raise ClipboardDecodeError('Long note ends before it starts', note_start)
+    return cls.from_triplet(column, first_position, second_position), offset + 1
 
 
 def decode_next_structure(stream: BytesIO, kind: int) -> StructureType:
     return STRUCTURE_REGISTRY[kind].decode(stream)
+
+
+def decode_structure_from(buffer, offset: int, kind: int) -> Tuple[StructureType, int]:
+    """Decode the `kind` structure at `offset` in `buffer`, return it and the offset right after it."""
+    return STRUCTURE_REGISTRY[kind].decode_from(buffer, offset)
+
+
+def decode_structures_from(buffer, offset: int, kind: int, count: int, strict: bool = False
+                           ) -> Tuple[List[StructureType], int]:
+    """Decode a group of `count` structures of the same `kind`, return them and the offset right after them.
+
+    With `strict`, the group is checked as it is decoded, see `checked_decoding`; `kind` is the byte before `offset`.
+    """
+    if not strict:
+        return STRUCTURE_REGISTRY[kind].decode_group_from(buffer, offset, count)
+
+    cls = STRUCTURE_REGISTRY.get(kind)
+    if cls is None:
+        raise ClipboardDecodeError(f'Unknown structure kind {kind}', offset - 1)
+    if cls is Label:
+        return decode_labels_checked(cls, buffer, offset, count)
+    return decode_group_checked(cls, buffer, offset, count)
@@ -1,9 +1,19 @@
+from array import array
 from io import BytesIO, StringIO
+from typing import Iterator
 
 from av_clipboard_lib.base_types import STRUCT_DWORD_U
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
 _KEY = [0x55 ** 4, 0x55 ** 3, 0x55 ** 2, 0x55 ** 1, 0x55 ** 0]
 
+# Below this many bytes (or characters) the array setup costs more than it saves.
+_NUMPY_THRESHOLD = 64
+
 
 def encode_dwords_to_base85(data: bytes) -> str:
     """Converts `data` into AV clipboard format
@@ -11,6 +21,74 @@ def encode_dwords_to_base85(data: bytes) -> str:
     >>> encode_dwords_to_base85(bytes.fromhex("C9E8C919DC2C7E0E"))
     'alphagamma'
     """
+    if numpy is not None and len(data) >= _NUMPY_THRESHOLD:
+        return _encode_dwords_to_base85_numpy(data)
+    return _encode_dwords_to_base85_python(data)
+
+
+def decode_dwords_from_base85(data: str) -> bytes:
+    """Convert `data` from AV clipboard format into bytes
+
+    >>> decode_dwords_from_base85('alphagamma').hex().upper()
+    'C9E8C919DC2C7E0E'
+    """
+    if numpy is not None and len(data) >= _NUMPY_THRESHOLD:
+        return _decode_dwords_from_base85_numpy(data)
+    return _decode_dwords_from_base85_python(data)
+
+
+def _text_size(data) -> int:
+    """Length of the base85 text of `data`, made of whole DWORDs"""
+    # Every DWORD takes 5 characters, except null ones that take a single "z".
+    dwords = array('I')
+    dwords.frombytes(data)
+    return 5 * len(dwords) - 4 * dwords.count(0)
+
+
+def splice_base85(text: str, data: bytes, start: int, end: int, shift: int) -> str:
+    """Same as `encode_dwords_to_base85(data)`, reusing `text`, the output for a previous payload.
+
+    That payload only differed in `data[start:end]`, bytes from `end` on being found `shift` bytes earlier in it.
+    Only the DWORDs around the change are encoded; the text after them is reused only if `shift` is a whole number
+    of DWORDs.
+
+    >>> splice_base85('alphagamma', bytes.fromhex("C9E8C91900000000DC2C7E0E"), 4, 8, 4)
+    'alphazgamma'
+    """
+    view = memoryview(data)
+    whole = len(data) - len(data) % 4
+    start -= start % 4
+    prefix = text[:_text_size(view[:start])]
+    if shift % 4 or end > whole:
+        return prefix + encode_dwords_to_base85(data[start:])
+
+    # The previous text ends with the same whole DWORDs, then the same last partial DWORD, if any.
+    end += -end % 4
+    text_end = len(text) - (len(data) > whole and len(data) - whole + 1)
+    suffix = text[text_end - _text_size(view[end:whole]):]
+    return prefix + encode_dwords_to_base85(data[start:end]) + suffix
+
+
+def iter_decode_dwords_from_base85(data: str, start: int = 0, chunk_size: int = 4096) -> Iterator[bytes]:
+    """Lazily convert `data[start:]` from AV clipboard format, `chunk_size` characters at a time.
+
+    >>> b''.join(iter_decode_dwords_from_base85('xxalphagamma', 2, chunk_size=3)).hex().upper()
+    'C9E8C919DC2C7E0E'
+    """
+    carry = ''
+
+    for chunk_start in range(start, len(data), chunk_size):
+        expanded = carry + decompress_base85(data[chunk_start:chunk_start + chunk_size])
+        aligned = len(expanded) - len(expanded) % 5
+        carry = expanded[aligned:]
+        if aligned:
+            yield decode_dwords_from_base85(expanded[:aligned])
+
+    if carry:
+        yield decode_dwords_from_base85(carry)
+
+
+def _encode_dwords_to_base85_python(data: bytes) -> str:
     segments = BytesIO()
 
     padding = (4 - len(data) % 4) % 4
@@ -33,12 +111,7 @@ def encode_dwords_to_base85(data: bytes) -> str:
     return compress_base85(string_out)
 
 
-def decode_dwords_from_base85(data: str) -> bytes:
-    """Convert `data` from AV clipboard format into bytes
-
-    >>> decode_dwords_from_base85('alphagamma').hex().upper()
-    'C9E8C919DC2C7E0E'
-    """
+def _decode_dwords_from_base85_python(data: str) -> bytes:
     byte_array = BytesIO()
 
     data = decompress_base85(data)
@@ -60,6 +133,49 @@ def decode_dwords_from_base85(data: str) -> bytes:
     return bytes(bytes_out)
 
 
+def _encode_dwords_to_base85_numpy(data: bytes) -> str:
+    padding = (4 - len(data) % 4) % 4
+    dwords = numpy.frombuffer(data + b'\x00' * padding, dtype='>u4').astype(numpy.int64)
+
+    digits = numpy.empty((len(dwords), 5), dtype=numpy.uint8)
+    for index, key in enumerate(_KEY):
+        digits[:, index] = 0x21 + (dwords // key) % 0x55
+
+    # A zero dword becomes a single "z", unless it is the truncated last group.
+    keep = numpy.ones(digits.shape, dtype=bool)
+    zeros = dwords == 0
+    if padding:
+        zeros[-1] = False
+        keep[-1, 5 - padding:] = False
+    digits[zeros, 0] = ord('z')
+    keep[zeros, 1:] = False
+
+    return digits[keep].tobytes().decode('ascii')
+
+
+def _decode_dwords_from_base85_numpy(data: str) -> bytes:
+    expanded = decompress_base85(data)
+
+    padding = (5 - len(expanded) % 5) % 5
+    try:
+        raw = (expanded + chr(0x21 + 0x55) * padding).encode('ascii')
+    except UnicodeEncodeError:
+        return _decode_dwords_from_base85_python(data)
+
+    digits = numpy.frombuffer(raw, dtype=numpy.uint8).reshape(-1, 5).astype(numpy.int64) - 0x21
+    dwords = digits @ numpy.array(_KEY, dtype=numpy.int64)
+
+    if ((dwords < 0) | (dwords > 0xFFFFFFFF)).any():
+        # Let the reference implementation raise the usual error.
+        return _decode_dwords_from_base85_python(data)
+
+    bytes_out = dwords.astype('>u4').tobytes()
+    if padding:
+        bytes_out = bytes_out[:-padding]
+
+    return bytes_out
+
+
 def decompress_base85(data: str) -> str:
     """Replace "z" with equivalent "!!!!!" in `data`."""
 
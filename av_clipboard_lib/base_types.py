@@ -1,10 +1,13 @@
+from functools import lru_cache
 from io import BytesIO
+from math import copysign
+from operator import ge, gt, le, lt
 from struct import Struct
 from typing import Union
 
 from attr import attrs
 
-from av_clipboard_lib.varint import decode_next_varint, encode_varint
+from av_clipboard_lib.varint import decode_varint_from, encode_varint
 
 STRUCT_BYTE = Struct('<B')
 STRUCT_CHAR = Struct('<c')
@@ -13,10 +16,56 @@ STRUCT_DWORD = Struct('<I')
 STRUCT_DWORD_U = Struct('>I')
 
 
-@attrs(auto_attribs=True, eq=True, order=True)
+def decode_from_stream(stream: BytesIO, decode_from, *args):
+    """Run the offset-based `decode_from` over the unread part of `stream`, mutating it."""
+    with stream.getbuffer() as view:
+        result, offset = decode_from(view, stream.tell(), *args)
+    stream.seek(offset)
+
+    return result
+
+
+@classmethod
+def decode_via_buffer(cls, stream: BytesIO):
+    """Stream-based wrapper around `cls.decode_from`."""
+    return decode_from_stream(stream, cls.decode_from)
+
+
+# Upper bound on the distinct positions kept by `RowPosition.of` and `TimePosition.of`.
+POSITION_CACHE_SIZE = 1 << 10
+
+
+def _compare_by(name: str):
+    """Plain ordering methods on the `name` attribute, cheaper than the attrs generated ones when sorting"""
+    def make(operator):
+        def compare(self, other):
+            if other.__class__ is not self.__class__:
+                return NotImplemented
+            return operator(getattr(self, name), getattr(other, name))
+
+        return compare
+
+    def decorate(cls):
+        cls.__lt__ = make(lt)
+        cls.__le__ = make(le)
+        cls.__gt__ = make(gt)
+        cls.__ge__ = make(ge)
+        return cls
+
+    return decorate
+
+
+@_compare_by('row')
+@attrs(auto_attribs=True, eq=True, slots=True, frozen=True, weakref_slot=False)
 class RowPosition:
     row: int
 
+    @staticmethod
+    @lru_cache(maxsize=POSITION_CACHE_SIZE)
+    def of(row: int) -> 'RowPosition':
+        """Return a shared instance for `row`, so that every note of a chord uses the same object."""
+        return RowPosition(row)
+
     @property
     def encoded_as_varint(self):
         return encode_varint(self.row)
@@ -29,24 +78,53 @@ class RowPosition:
 
     @classmethod
     def decode_next_as_varint(cls, stream: BytesIO):
-        return cls(decode_next_varint(stream))
+        return decode_from_stream(stream, cls.decode_from_as_varint)
 
     @classmethod
     def decode_next_as_dword(cls, stream: BytesIO):
-        return cls(*STRUCT_DWORD.unpack(stream.read(4)))
+        return decode_from_stream(stream, cls.decode_from_as_dword)
+
+    @classmethod
+    def decode_from_as_varint(cls, buffer, offset: int):
+        row, offset = decode_varint_from(buffer, offset)
+        return cls.of(row), offset
+
+    @classmethod
+    def decode_from_as_dword(cls, buffer, offset: int):
+        row, = STRUCT_DWORD.unpack_from(buffer, offset)
+        return cls.of(row), offset + 4
 
 
-@attrs(auto_attribs=True, eq=True, order=True)
+@_compare_by('seconds')
+@attrs(auto_attribs=True, eq=True, slots=True, frozen=True, weakref_slot=False)
 class TimePosition:
     seconds: float
 
+    @staticmethod
+    def of(seconds: float) -> 'TimePosition':
+        """Return a shared instance for `seconds`, so that every note of a chord uses the same object."""
+        # The cache takes -0.0 for 0.0, which would lose its sign bit on the way back out.
+        if not seconds and copysign(1.0, seconds) < 0:
+            return TimePosition(seconds)
+        return _shared_time_position(seconds)
+
     @property
     def encoded(self):
         return STRUCT_DOUBLE.pack(self.seconds)
 
     @classmethod
     def decode_next(cls, stream: BytesIO):
-        return cls(*STRUCT_DOUBLE.unpack(stream.read(8)))
+        return decode_from_stream(stream, cls.decode_from)
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int):
+        seconds, = STRUCT_DOUBLE.unpack_from(buffer, offset)
+        return cls.of(seconds), offset + 8
+
+
+@lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _shared_time_position(seconds: float) -> TimePosition:
+    return TimePosition(seconds)
 
 
 PositionValue = Union[RowPosition, TimePosition]
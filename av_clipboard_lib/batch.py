@@ -0,0 +1,144 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Iterable, List, Optional, Union
+
+from attr import attrs
+
+from av_clipboard_lib.base85 import encode_dwords_to_base85
+from av_clipboard_lib.chord_copy import ChordCopy
+from av_clipboard_lib.clipboard_data import CopySnapshot, CopyType, RowCopy, StructureCopy, TimeCopy, \
+    _decode_av_clipboard_payload
+from av_clipboard_lib.containers import STRUCTURE_ORDER, presorted
+from av_clipboard_lib.note_array import NoteArray
+from av_clipboard_lib.structure_array import StructureArray
+
+ProducibleType = Union[CopyType, CopySnapshot, ChordCopy, NoteArray, StructureArray]
+
+
+@attrs(auto_attribs=True, slots=True)
+class BatchResult:
+    """Outcome of one item of a batch: either its `value` or the `error` it raised."""
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _chunked(items: Iterable, size: int):
+    items = iter(items)
+    return iter(lambda: [*islice(items, size)], [])
+
+
+def _parse_compact(data: str):
+    """Decode `data` into a payload that is cheap to send between processes."""
+    payload = _decode_av_clipboard_payload(data)
+    if data.startswith('ArrowVortex:notes:'):
+        notes, _ = NoteArray.decode_from(payload, 1, bool(payload[0]))
+        notes.check_kinds()
+        return notes
+
+    # Columns are cheaper to send back than the objects, and the parent does not have to decode anything again.
+    copy, _ = StructureCopy.decode_from(payload, 0)
+    return StructureArray.from_objects(copy.objects)
+
+
+def _parse_chunk(chunk: List[str]) -> List[BatchResult]:
+    results = []
+    for data in chunk:
+        try:
+            results.append(BatchResult(_parse_compact(data)))
+        except Exception as error:
+            results.append(BatchResult(error=error))
+    return results
+
+
+def _produce_chunk(chunk: List[Any]) -> List[BatchResult]:
+    results = []
+    for compact in chunk:
+        try:
+            if isinstance(compact, str):
+                text = compact
+            elif isinstance(compact, NoteArray):
+                text = f'ArrowVortex:notes:{encode_dwords_to_base85(compact.encoded)}'
+            elif isinstance(compact, bytes):
+                text = f'ArrowVortex:tempo:{encode_dwords_to_base85(compact)}'
+            else:
+                raise ValueError(f'Cannot produce AV clipboard data from {type(compact).__name__}')
+            results.append(BatchResult(text))
+        except Exception as error:
+            results.append(BatchResult(error=error))
+    return results
+
+
+def _run_chunks(worker, items: Iterable, max_workers: Optional[int], chunk_size: int) -> List[BatchResult]:
+    chunks = _chunked(items, chunk_size)
+
+    if max_workers == 1:
+        chunk_results = map(worker, chunks)
+        return [result for results in chunk_results for result in results]
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        return [result for results in executor.map(worker, chunks) for result in results]
+
+
+def _expand(result: BatchResult, columnar: bool) -> BatchResult:
+    if not result.ok:
+        return result
+
+    compact = result.value
+    try:
+        if isinstance(compact, NoteArray):
+            if columnar:
+                return result
+            copy_type = compact.is_time and TimeCopy or RowCopy
+            return BatchResult(copy_type.from_note_array(compact))
+
+        return BatchResult(StructureCopy(presorted(compact.to_objects(), STRUCTURE_ORDER)))
+    except Exception as error:
+        return BatchResult(error=error)
+
+
+def parse_many(
+        data: Iterable[str],
+        max_workers: Optional[int] = None,
+        chunk_size: int = 256,
+        columnar: bool = False
+) -> List[BatchResult]:
+    """Parse many AV clipboard strings across a process pool, keeping the input order.
+
+    Every item gets a `BatchResult`, a malformed string only fails its own item.
+    With `columnar`, note copies are returned as `NoteArray` instead of `RowCopy`/`TimeCopy`.
+    `max_workers=1` runs everything in the current process.
+    """
+    return [
+        _expand(result, columnar)
+        for result in _run_chunks(_parse_chunk, data, max_workers, chunk_size)
+    ]
+
+
+def _compact_copy(copy: ProducibleType):
+    """Flatten `copy` into what `_produce_chunk` takes: note columns, tempo payload bytes or finished text."""
+    if isinstance(copy, CopySnapshot):
+        return copy.text
+    if isinstance(copy, NoteArray):
+        return copy
+    if isinstance(copy, (RowCopy, TimeCopy, ChordCopy)):
+        return copy.to_note_array()
+    if isinstance(copy, (StructureCopy, StructureArray)):
+        return copy.encoded
+    # Anything else fails its own item in the worker.
+    return copy
+
+
+def produce_many(
+        copies: Iterable[ProducibleType],
+        max_workers: Optional[int] = None,
+        chunk_size: int = 256
+) -> List[BatchResult]:
+    """Produce AV clipboard strings for many copies across a process pool, keeping the input order.
+
+    Copies are flattened into columns or raw bytes before being sent to the workers, snapshots send their text.
+    """
+    return _run_chunks(_produce_chunk, map(_compact_copy, copies), max_workers, chunk_size)
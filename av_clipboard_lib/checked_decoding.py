@@ -0,0 +1,127 @@
+"""Checks of strict decoding, which rejects malformed AV clipboard data instead of misreading it.
+
+The offset-based decoders call these in the same pass when `strict` is set: bounds, note and structure kinds,
+overlong varints, NaN or negative times, long notes ending before they start, and bytes left after the declared
+objects. Errors are `ClipboardDecodeError`, carrying the offset in the payload where the problem is.
+"""
+from typing import List, Tuple
+
+from av_clipboard_lib.base_types import RowPosition, STRUCT_DOUBLE, STRUCT_DWORD, TimePosition
+from av_clipboard_lib.varint import decode_varint_from
+
+
+class ClipboardDecodeError(ValueError):
+    """Malformed AV clipboard data, `offset` is where the problem is in the decoded payload."""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(f'{message} at byte {offset}')
+        self.message = message
+        self.offset = offset
+
+    def __reduce__(self):
+        # Errors of worker processes are pickled, and `args` only holds the formatted message.
+        return self.__class__, (self.message, self.offset)
+
+
+def decode_varint_checked(buffer, offset: int) -> Tuple[int, int]:
+    """Same as `decode_varint_from`, but reject truncated, overlong and over 64 bit varints."""
+    start = offset
+    result = shift = 0
+    while True:
+        if offset >= len(buffer):
+            raise ClipboardDecodeError('Payload ends in the middle of a varint', start)
+        next_byte = buffer[offset]
+        offset += 1
+        result |= (next_byte & 0x7F) << shift
+
+        if not next_byte & 0x80:
+            if not next_byte and offset - start > 1:
+                raise ClipboardDecodeError('Overlong varint', start)
+            return result, offset
+
+        shift += 7
+        if shift > 63:
+            raise ClipboardDecodeError('Varint is longer than 64 bits', start)
+
+
+def decode_row_checked(buffer, offset: int) -> Tuple[RowPosition, int]:
+    """Same as `RowPosition.decode_from_as_varint`, but reject overlong and over 64 bit varints.
+
+    A varint cut short raises IndexError like in lenient decoding, for the copy decoders to report.
+    """
+    row = buffer[offset]
+    if not row & 0x80:
+        return RowPosition.of(row), offset + 1
+
+    start = offset
+    row, offset = decode_varint_from(buffer, offset)
+    # A last byte adding nothing means the varint could have been shorter.
+    if not buffer[offset - 1]:
+        raise ClipboardDecodeError('Overlong varint', start)
+    if row >> 64:
+        raise ClipboardDecodeError('Varint is longer than 64 bits', start)
+    return RowPosition.of(row), offset
+
+
+def decode_time_checked(buffer, offset: int) -> Tuple[TimePosition, int]:
+    """Same as `TimePosition.decode_from`, but reject negative and NaN times."""
+    seconds, = STRUCT_DOUBLE.unpack_from(buffer, offset)
+    # Also true for NaN, which compares false to everything.
+    if not seconds >= 0:
+        raise ClipboardDecodeError(f'Note time {seconds} is negative or NaN', offset)
+    return TimePosition.of(seconds), offset + 8
+
+
+def check_note_count(buffer, offset: int, count: int):
+    """Reject a `count` of notes starting at `offset` that cannot fit in `buffer`."""
+    # Every note takes at least two bytes.
+    if count > (len(buffer) - offset) // 2:
+        raise ClipboardDecodeError(f'{count} notes declared, but only {len(buffer) - offset} bytes follow', offset)
+
+
+def decode_labels_checked(cls, buffer, offset: int, count: int) -> Tuple[list, int]:
+    """Same as `Label.decode_group_from`, but reject cut short and non ASCII messages."""
+    labels = []
+    for _ in range(count):
+        label_start = offset
+        if offset + 4 > len(buffer):
+            raise ClipboardDecodeError('Payload ends in the middle of a label', label_start)
+        row, = STRUCT_DWORD.unpack_from(buffer, offset)
+        message_len, offset = decode_varint_checked(buffer, offset + 4)
+        if offset + message_len > len(buffer):
+            raise ClipboardDecodeError(f'Label message of {message_len} bytes is cut short', label_start)
+
+        try:
+            message = bytes(buffer[offset:offset + message_len]).decode('ascii')
+        except UnicodeDecodeError:
+            raise ClipboardDecodeError('Label message is not ASCII', offset) from None
+        labels.append(cls(RowPosition.of(row), message))
+        offset += message_len
+    return labels, offset
+
+
+def decode_group_checked(cls, buffer, offset: int, count: int) -> Tuple[list, int]:
+    """Same as `decode_group_from` of the fixed-size structure class `cls`, but reject cut short groups and NaN."""
+    size = cls.STRUCT.size
+    if offset + count * size > len(buffer):
+        raise ClipboardDecodeError(
+            f'{count} {cls.__name__} structures declared, but only {len(buffer) - offset} bytes follow', offset
+        )
+    group, end = cls.decode_group_from(buffer, offset, count)
+    _check_floats(cls, group, offset)
+    return group, end
+
+
+def _check_floats(cls, group: List, offset: int):
+    names = [name for name, code in zip(cls.FIELDS, cls.FIELD_CODES) if code == 'd']
+    for index, structure in enumerate(group):
+        for name in names:
+            value = getattr(structure, name)
+            if value != value:
+                raise ClipboardDecodeError(f'{cls.__name__} {name} is NaN', offset + index * cls.STRUCT.size)
+
+
+def check_consumed(buffer, offset: int):
+    """Reject bytes left in `buffer` after the declared objects, which end at `offset`."""
+    if offset != len(buffer):
+        raise ClipboardDecodeError(f'{len(buffer) - offset} bytes left after the declared objects', offset)
@@ -0,0 +1,202 @@
+"""Compact storage of row copies made mostly of tap chords.
+
+Taps are kept as one column bitmask per row, in a QWORD array next to the sorted array of rows;
+every other note lives in a `NoteArray` side table. So do the few taps a bitmask cannot hold:
+taps past column 63, and taps repeated on the same row and column.
+Side notes sharing a row and column with a bitmask tap remember whether they came before it,
+so notes come back in their original order.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from attr import attrib, attrs
+
+from av_clipboard_lib.av_objects import LongNote, NOTE_REGISTRY, NoteType
+from av_clipboard_lib.base_types import RowPosition, STRUCT_BYTE, decode_via_buffer
+from av_clipboard_lib.note_array import NoteArray, TAP_KIND, _LONG_KINDS
+from av_clipboard_lib.varint import decode_varint_from, encode_varint
+
+# Columns that fit in a QWORD bitmask.
+MASK_COLUMNS = 64
+
+_TAP = NOTE_REGISTRY[None]
+
+
+def _mask_columns(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _sorted_chords(chords: Dict[int, int]) -> Tuple[array, array]:
+    # Copies are nearly always sorted already, which makes this sort linear.
+    rows = array('Q', sorted(chords))
+    return rows, array('Q', map(chords.__getitem__, rows))
+
+
+@attrs(auto_attribs=True, slots=True)
+class ChordCopy:
+    """Notes of a row copy, taps as the column bitmask `masks[i]` of each of the sorted, distinct `rows`.
+
+    Other notes are kept in `others`, `before_taps[i]` being set if `others[i]` came before the bitmask tap
+    on its row and column. Rows and masks are not meant to be edited in place,
+    as the row lookup behind `chord_at` and `has_tap` is built once, on first use.
+    """
+    rows: array = attrib(factory=lambda: array('Q'))
+    masks: array = attrib(factory=lambda: array('Q'))
+    others: NoteArray = attrib(factory=lambda: NoteArray(False))
+    before_taps: array = attrib(factory=lambda: array('B'))
+    _row_index: Optional[Dict[int, int]] = attrib(default=None, init=False, eq=False, repr=False)
+
+    def __len__(self):
+        return sum(bin(mask).count('1') for mask in self.masks) + len(self.others)
+
+    @property
+    def chord_count(self) -> int:
+        return len(self.rows)
+
+    def chord_at(self, row: int) -> int:
+        """Bitmask of the tap columns at `row`, 0 if it has none."""
+        row_index = self._row_index
+        if row_index is None:
+            row_index = self._row_index = {row: index for index, row in enumerate(self.rows)}
+        index = row_index.get(row)
+        return 0 if index is None else self.masks[index]
+
+    def has_tap(self, row: int, column: int) -> bool:
+        """Whether the chord at `row` has a tap on `column`; taps of the side table are not looked up."""
+        return bool(self.chord_at(row) >> column & 1)
+
+    @classmethod
+    def from_objects(cls, objects: Iterable[NoteType]):
+        chords = {}
+        others = NoteArray(False)
+        before_taps = array('B')
+        for note in objects:
+            column = note.column
+            row = (note.start_position if isinstance(note, LongNote) else note.position).row
+            bit = 1 << column if column < MASK_COLUMNS else 0
+            mask = chords.get(row, 0)
+            if note.__class__ is _TAP and bit and not mask & bit:
+                chords[row] = mask | bit
+                continue
+            others.append(note)
+            before_taps.append(not mask & bit)
+
+        rows, masks = _sorted_chords(chords)
+        return cls(rows, masks, others, before_taps)
+
+    @classmethod
+    def from_note_array(cls, notes: NoteArray):
+        if notes.is_time:
+            raise ValueError('Chord copies only hold row based notes')
+        return cls.from_objects(notes)
+
+    def _iter_merged(self) -> Iterator[Tuple[int, int, Optional[int]]]:
+        """Yield the row and column of every note in copy order, with its index in `others` unless it is a tap.
+
+        Notes of the side table on the same row and column as a tap stay on the side of it they came from.
+        """
+        others, before_taps = self.others, self.before_taps
+        columns, starts = others.columns, others.starts
+        side = others.sorted_indices
+        next_side, side_count = 0, len(side)
+
+        for row, mask in zip(self.rows, self.masks):
+            for column in _mask_columns(mask):
+                while next_side < side_count:
+                    index = side[next_side]
+                    key = starts[index], columns[index]
+                    if key > (row, column) or key == (row, column) and not before_taps[index]:
+                        break
+                    yield starts[index], columns[index], index
+                    next_side += 1
+                yield row, column, None
+
+        for index in side[next_side:]:
+            yield starts[index], columns[index], index
+
+    def to_objects(self) -> List[NoteType]:
+        """Notes of the copy as objects, sorted the way `RowCopy` sorts them."""
+        others = self.others
+        return [
+            _TAP(column, RowPosition.of(row)) if index is None else others[index]
+            for row, column, index in self._iter_merged()
+        ]
+
+    def to_note_array(self) -> NoteArray:
+        return NoteArray.from_objects(self.to_objects(), False)
+
+    decode = decode_via_buffer
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int):
+        """Decode a row copy body at `offset` in `buffer` straight into chords, without making tap objects."""
+        count, offset = decode_varint_from(buffer, offset)
+
+        chords = {}
+        others = NoteArray(False)
+        before_taps = array('B')
+        columns, kinds, starts, ends = others.columns, others.kinds, others.starts, others.ends
+
+        for _ in range(count):
+            first_byte = buffer[offset]
+            start, offset = decode_varint_from(buffer, offset + 1)
+
+            if first_byte & 0x80:
+                end, offset = decode_varint_from(buffer, offset)
+                kind = buffer[offset]
+                offset += 1
+                if kind not in _LONG_KINDS:
+                    end = start
+                columns.append(first_byte ^ 0x80)
+            else:
+                if first_byte < MASK_COLUMNS:
+                    bit = 1 << first_byte
+                    mask = chords.get(start, 0)
+                    if not mask & bit:
+                        chords[start] = mask | bit
+                        continue
+                end = start
+                kind = TAP_KIND
+                columns.append(first_byte)
+
+            kinds.append(kind)
+            starts.append(start)
+            ends.append(end)
+            column = columns[-1]
+            before_taps.append(column >= MASK_COLUMNS or not chords.get(start, 0) >> column & 1)
+
+        rows, masks = _sorted_chords(chords)
+        return cls(rows, masks, others, before_taps), offset
+
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield the encoded copy piece by piece, the same bytes as the equivalent `RowCopy`.
+
+        The wire format still repeats the row of every note, but each row is encoded only once per chord.
+        """
+        others = self.others
+        kinds, ends = others.kinds, others.ends
+
+        yield b'\x00'
+        yield encode_varint(len(self))
+        last_row = encoded_row = None
+        for row, column, index in self._iter_merged():
+            if row != last_row:
+                last_row, encoded_row = row, encode_varint(row)
+
+            kind = TAP_KIND if index is None else kinds[index]
+            if kind == TAP_KIND:
+                yield STRUCT_BYTE.pack(column)
+                yield encoded_row
+                continue
+
+            yield STRUCT_BYTE.pack(column | 0x80)
+            yield encoded_row
+            yield kind in _LONG_KINDS and encode_varint(ends[index]) or encoded_row
+            yield STRUCT_BYTE.pack(kind)
+
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
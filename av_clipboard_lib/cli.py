@@ -0,0 +1,467 @@
+"""Bulk conversion of files holding one AV clipboard string per line, run as `python -m av_clipboard_lib`.
+
+    python -m av_clipboard_lib export copies.txt copies.jsonl
+    python -m av_clipboard_lib import copies.jsonl copies.txt --workers 8
+
+`export` turns clipboard strings into JSON lines, CSV or columnar records, `import` turns those back into
+clipboard strings. The input is memory mapped and cut into chunks on line, or record, boundaries.
+Worker processes convert one chunk each into a part file, and the parts are joined in order,
+so memory use stays around a line per worker however large the input is.
+
+Formats, all of them lossless:
+
+- jsonl: an object per copy with its `line`, its `copy` type (row, time or tempo)
+  and the columns of its `NoteArray` or `StructureArray`
+- csv: a row per note or structure, see `CSV_HEADER`, an empty copy gets a row with no kind
+- columnar: a record per copy, its line number and size as QWORDs then its `dumps_columnar` data,
+  padded to 8 bytes
+
+Lines that fail to convert are left out of the output and reported as `input:line: error`,
+where line is the number of the record for columnar input.
+"""
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from struct import Struct
+from typing import Iterator, List, Optional, TextIO, Tuple, Union
+
+from attr import attrs
+
+from av_clipboard_lib.clipboard_data import parse_av_clipboard_data, parse_av_clipboard_notes, \
+    produce_av_clipboard_data
+from av_clipboard_lib.columnar_file import ColumnarType, dumps_columnar, loads_columnar, to_columnar
+from av_clipboard_lib.note_array import NoteArray
+from av_clipboard_lib.structure_array import StructureArray, VALUE_COLUMNS
+
+EXPORT = 'export'
+IMPORT = 'import'
+
+JSONL = 'jsonl'
+CSV = 'csv'
+COLUMNAR = 'columnar'
+# Formats guessed from the suffix of the file that is not made of clipboard strings.
+SUFFIX_FORMATS = {'.jsonl': JSONL, '.csv': CSV, '.avcf': COLUMNAR}
+
+CSV_HEADER = ('line', 'copy', 'kind', 'column', 'start', 'end', 'value0', 'value1', 'value2', 'message')
+
+DEFAULT_CHUNK_SIZE = 16 << 20
+
+# line number, size of the columnar data that follows
+_RECORD = Struct('<QQ')
+_ALIGNMENT = 8
+# Newlines are counted this many bytes at a time, so counting needs no more memory than that.
+_COUNT_SLICE = 1 << 20
+
+Unit = Tuple[int, bytes]
+
+
+@attrs(auto_attribs=True, slots=True)
+class ConversionSummary:
+    """Number of lines or records `converted` and `failed`, and how long the conversion took."""
+    converted: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+def _copy_name(elmns: ColumnarType) -> str:
+    if isinstance(elmns, StructureArray):
+        return 'tempo'
+    return elmns.is_time and 'time' or 'row'
+
+
+def _columns_of(text: str, strict: bool) -> ColumnarType:
+    """Parse clipboard `text` into its array form, straight into columns unless `strict`."""
+    if strict:
+        return to_columnar(parse_av_clipboard_data(text, strict=True))
+    if text.startswith('ArrowVortex:notes:'):
+        notes = parse_av_clipboard_notes(text)
+        notes.check_kinds()
+        return notes
+    return to_columnar(parse_av_clipboard_data(text))
+
+
+def _note_array(copy: str, columns, kinds, starts, ends) -> NoteArray:
+    if copy not in {'row', 'time'}:
+        raise ValueError(f'Unknown copy type {copy!r}')
+    is_time = copy == 'time'
+    typecode = is_time and 'd' or 'Q'
+    return NoteArray(is_time, array('B', columns), array('B', kinds), array(typecode, starts), array(typecode, ends))
+
+
+def _check_lengths(elmns: ColumnarType):
+    if isinstance(elmns, NoteArray):
+        columns = (elmns.columns, elmns.starts, elmns.ends)
+    else:
+        if len(elmns.values) != VALUE_COLUMNS:
+            raise ValueError(f'Expected {VALUE_COLUMNS} value columns, got {len(elmns.values)}')
+        columns = (elmns.rows, elmns.messages, *elmns.values)
+    if any(len(column) != len(elmns) for column in columns):
+        raise ValueError('Columns are not all the same length')
+
+
+def _export_jsonl(elmns: ColumnarType, line: int) -> bytes:
+    record = {'line': line, 'copy': _copy_name(elmns)}
+    if isinstance(elmns, NoteArray):
+        record.update(
+            columns=elmns.columns.tolist(), kinds=elmns.kinds.tolist(),
+            starts=elmns.starts.tolist(), ends=elmns.ends.tolist(),
+        )
+    else:
+        record.update(
+            kinds=elmns.kinds.tolist(), rows=elmns.rows.tolist(),
+            values=[column.tolist() for column in elmns.values], messages=[*elmns.messages],
+        )
+    return json.dumps(record, separators=(',', ':')).encode('ascii') + b'\n'
+
+
+def _import_jsonl(unit: bytes) -> ColumnarType:
+    record = json.loads(unit)
+    if record['copy'] == 'tempo':
+        return StructureArray(
+            array('B', record['kinds']), array('I', record['rows']),
+            [array('d', column) for column in record['values']], record['messages'],
+        )
+    return _note_array(record['copy'], record['columns'], record['kinds'], record['starts'], record['ends'])
+
+
+def _escape(message: str) -> str:
+    # Keeps every row on a single line, which is what chunks are cut on.
+    return message.encode('unicode_escape').decode('ascii')
+
+
+def _unescape(message: str) -> str:
+    return message.encode('ascii').decode('unicode_escape')
+
+
+def _export_csv(elmns: ColumnarType, line: int) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    copy = _copy_name(elmns)
+    if not len(elmns):
+        writer.writerow((line, copy) + ('',) * (len(CSV_HEADER) - 2))
+    elif isinstance(elmns, NoteArray):
+        writer.writerows(
+            (line, copy, kind, column, start, end, '', '', '', '')
+            for column, kind, start, end in zip(elmns.columns, elmns.kinds, elmns.starts, elmns.ends)
+        )
+    else:
+        writer.writerows(
+            (line, copy, kind, '', row, '', *values, _escape(message))
+            for kind, row, values, message in zip(elmns.kinds, elmns.rows, zip(*elmns.values), elmns.messages)
+        )
+    return out.getvalue().encode('ascii')
+
+
+def _import_csv(unit: bytes) -> ColumnarType:
+    rows = [*csv.reader(io.StringIO(unit.decode('ascii')))]
+    copy = rows[0][1]
+    rows = [row for row in rows if row[2]]
+    if copy == 'tempo':
+        return StructureArray(
+            array('B', [int(row[2]) for row in rows]), array('I', [int(row[4]) for row in rows]),
+            [array('d', [float(row[6 + index]) for row in rows]) for index in range(VALUE_COLUMNS)],
+            [_unescape(row[9]) for row in rows],
+        )
+
+    position = copy == 'time' and float or int
+    return _note_array(
+        copy, [int(row[3]) for row in rows], [int(row[2]) for row in rows],
+        [position(row[4]) for row in rows], [position(row[5]) for row in rows],
+    )
+
+
+def _export_columnar(elmns: ColumnarType, line: int) -> bytes:
+    data = dumps_columnar(elmns)
+    return b''.join((_RECORD.pack(line, len(data)), data, bytes(-len(data) % _ALIGNMENT)))
+
+
+def _import_columnar(unit: bytes) -> ColumnarType:
+    return loads_columnar(unit)
+
+
+_EXPORTERS = {JSONL: _export_jsonl, CSV: _export_csv, COLUMNAR: _export_columnar}
+_IMPORTERS = {JSONL: _import_jsonl, CSV: _import_csv, COLUMNAR: _import_columnar}
+
+
+def _iter_line_spans(mapping: mmap.mmap, start: int, end: int, first: int) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield the number, offset and content of the lines starting in `[start, end)`."""
+    number, offset = first, start
+    while offset < end:
+        newline = mapping.find(b'\n', offset)
+        if newline < 0:
+            newline = len(mapping)
+        yield number, offset, mapping[offset:newline].rstrip(b'\r')
+        number, offset = number + 1, newline + 1
+
+
+def _iter_lines(mapping: mmap.mmap, start: int, end: int, first: int) -> Iterator[Unit]:
+    """Yield the number and content of the lines starting in `[start, end)`, skipping blank ones."""
+    for number, _, line in _iter_line_spans(mapping, start, end, first):
+        if line:
+            yield number, line
+
+
+def _csv_key(line: bytes) -> bytes:
+    return line.split(b',', 1)[0]
+
+
+def _iter_csv_copies(mapping: mmap.mmap, start: int, end: int, first: int) -> Iterator[Unit]:
+    """Yield the number of the first row and the rows of every copy whose first row is in `[start, end)`.
+
+    The last copy is followed past `end`, rows continuing a copy from before `start` are left to the chunk before.
+    """
+    if start:
+        previous = mapping.rfind(b'\n', 0, start - 1) + 1
+        skipped = _csv_key(mapping[previous:start - 1].rstrip(b'\r'))
+    else:
+        skipped = _csv_key(','.join(CSV_HEADER).encode('ascii'))
+
+    key = number = None
+    rows = []
+    for line_number, offset, line in _iter_line_spans(mapping, start, len(mapping), first):
+        if not line:
+            continue
+        line_key = _csv_key(line)
+        if line_key == skipped:
+            continue
+        skipped = None
+        if line_key != key:
+            if rows:
+                yield number, b'\n'.join(rows)
+                rows = []
+            if offset >= end:
+                return
+            key, number = line_key, line_number
+        rows.append(line)
+
+    if rows:
+        yield number, b'\n'.join(rows)
+
+
+def _line_count(mapping: mmap.mmap, start: int, end: int) -> int:
+    count = 0
+    for offset in range(start, end, _COUNT_SLICE):
+        count += mapping[offset:min(offset + _COUNT_SLICE, end)].count(b'\n')
+    return count
+
+
+def _iter_records(mapping: mmap.mmap, start: int, end: int, first: int) -> Iterator[Unit]:
+    """Yield the number and columnar data of the records in `[start, end)`."""
+    number, offset = first, start
+    while offset < end:
+        if offset + _RECORD.size > end:
+            # Too short to be columnar data, which makes loading it fail.
+            yield number, mapping[offset:end]
+            return
+        _, size = _RECORD.unpack_from(mapping, offset)
+        offset += _RECORD.size
+        yield number, mapping[offset:offset + size]
+        number, offset = number + 1, offset + size + -size % _ALIGNMENT
+
+
+def _is_record_input(direction: str, fmt: str) -> bool:
+    return direction == IMPORT and fmt == COLUMNAR
+
+
+def _iter_units(mapping: mmap.mmap, start: int, end: int, first: int, direction: str, fmt: str) -> Iterator[Unit]:
+    if _is_record_input(direction, fmt):
+        return _iter_records(mapping, start, end, first)
+    if direction == IMPORT and fmt == CSV:
+        return _iter_csv_copies(mapping, start, end, first)
+    return _iter_lines(mapping, start, end, first)
+
+
+def _convert_unit(unit: bytes, number: int, direction: str, fmt: str, strict: bool) -> bytes:
+    if direction == EXPORT:
+        return _EXPORTERS[fmt](_columns_of(unit.decode('ascii'), strict), number)
+
+    elmns = _IMPORTERS[fmt](unit)
+    _check_lengths(elmns)
+    return produce_av_clipboard_data(elmns, validate=strict).encode('ascii') + b'\n'
+
+
+@contextmanager
+def _mapped(path: str):
+    with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapping
+    finally:
+        mapping.close()
+
+
+def _count_lines(task: Tuple[str, int, int]) -> int:
+    path, start, end = task
+    with _mapped(path) as mapping:
+        return _line_count(mapping, start, end)
+
+
+def _convert_chunk(task: tuple) -> Tuple[int, int]:
+    """Convert a chunk of the input into its part file, and its failures into the part file with `.err` added."""
+    path, start, end, first, direction, fmt, strict, part_path = task
+    converted = failed = 0
+    with _mapped(path) as mapping, open(part_path, 'wb') as part, open(part_path + '.err', 'w') as errors:
+        for number, unit in _iter_units(mapping, start, end, first, direction, fmt):
+            try:
+                part.write(_convert_unit(unit, number, direction, fmt, strict))
+            except Exception as error:
+                errors.write(f'{number}: {type(error).__name__}: {error}\n')
+                failed += 1
+            else:
+                converted += 1
+    return converted, failed
+
+
+def _line_boundaries(mapping: mmap.mmap, chunk_size: int) -> List[int]:
+    boundaries = [0]
+    while boundaries[-1] + chunk_size < len(mapping):
+        newline = mapping.find(b'\n', boundaries[-1] + chunk_size)
+        if newline < 0 or newline + 1 == len(mapping):
+            break
+        boundaries.append(newline + 1)
+    boundaries.append(len(mapping))
+    return boundaries
+
+
+def _record_boundaries(mapping: mmap.mmap, chunk_size: int) -> Tuple[List[int], List[int]]:
+    """Offsets cutting records into chunks of about `chunk_size` bytes, with the number of the first record of each."""
+    boundaries, firsts = [0], [1]
+    offset = count = 0
+    while offset + _RECORD.size <= len(mapping):
+        _, size = _RECORD.unpack_from(mapping, offset)
+        offset += _RECORD.size + size + -size % _ALIGNMENT
+        count += 1
+        if offset - boundaries[-1] >= chunk_size and offset < len(mapping):
+            boundaries.append(offset)
+            firsts.append(count + 1)
+    boundaries.append(len(mapping))
+    return boundaries, firsts
+
+
+@contextmanager
+def _mapper(max_workers: Optional[int]):
+    if max_workers == 1:
+        yield map
+        return
+    with ProcessPoolExecutor(max_workers) as executor:
+        yield executor.map
+
+
+def _report_progress(progress: TextIO, done: int, total: int, summary: ConversionSummary, started: float):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    progress.write(
+        f'\r{done * 100 / max(total, 1):5.1f}% of {total / (1 << 20):.1f} MiB, '
+        f'{summary.converted} converted, {summary.failed} failed, {done / (1 << 20) / elapsed:.1f} MiB/s'
+    )
+    progress.flush()
+
+
+def convert_file(input_path: str, output_path: str, direction: str, fmt: str = JSONL,
+                 max_workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE, strict: bool = False,
+                 errors: TextIO = sys.stderr, progress: Optional[TextIO] = None) -> ConversionSummary:
+    """Convert the file at `input_path` into `output_path`, see the module documentation.
+
+    `direction` is `EXPORT` or `IMPORT`, `fmt` one of `JSONL`, `CSV` and `COLUMNAR`.
+    Each task converts about `chunk_size` bytes of input, `max_workers=1` runs everything in the current process.
+    With `strict`, clipboard strings are decoded with `strict=True` and notes are validated before being produced.
+    Failed lines are written to `errors`, progress is reported to `progress` if given.
+    """
+    if direction not in {EXPORT, IMPORT}:
+        raise ValueError(f'Unknown direction {direction!r}')
+    if fmt not in _EXPORTERS:
+        raise ValueError(f'Unknown format {fmt!r}')
+    if chunk_size <= 0:
+        raise ValueError('Chunk size must be positive')
+
+    started = time.perf_counter()
+    summary = ConversionSummary()
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+
+    with open(output_path, 'wb') as output, tempfile.TemporaryDirectory(dir=output_dir) as parts:
+        if direction == EXPORT and fmt == CSV:
+            output.write(','.join(CSV_HEADER).encode('ascii') + b'\n')
+        if not os.path.getsize(input_path):
+            summary.seconds = time.perf_counter() - started
+            return summary
+
+        with _mapped(input_path) as mapping, _mapper(max_workers) as map_:
+            total = len(mapping)
+            if _is_record_input(direction, fmt):
+                boundaries, firsts = _record_boundaries(mapping, chunk_size)
+            else:
+                boundaries = _line_boundaries(mapping, chunk_size)
+                counts = map_(_count_lines, [(input_path, *bounds) for bounds in zip(boundaries, boundaries[1:])])
+                firsts = [1]
+                for count in counts:
+                    firsts.append(firsts[-1] + count)
+
+            tasks = [
+                (input_path, start, end, first, direction, fmt, strict, os.path.join(parts, str(index)))
+                for index, (start, end, first) in enumerate(zip(boundaries, boundaries[1:], firsts))
+            ]
+            # Parts are joined in order as soon as they are ready, and removed right away.
+            for task, (converted, failed) in zip(tasks, map_(_convert_chunk, tasks)):
+                _, start, end, *_, part_path = task
+                with open(part_path, 'rb') as part:
+                    shutil.copyfileobj(part, output)
+                os.remove(part_path)
+                with open(part_path + '.err') as part_errors:
+                    for line in part_errors:
+                        errors.write(f'{input_path}:{line}')
+                os.remove(part_path + '.err')
+
+                summary.converted += converted
+                summary.failed += failed
+                if progress is not None:
+                    _report_progress(progress, end, total, summary, started)
+
+    if progress is not None:
+        progress.write('\n')
+    summary.seconds = time.perf_counter() - started
+    return summary
+
+
+def _guess_format(path: str) -> str:
+    return SUFFIX_FORMATS.get(os.path.splitext(path)[1].lower(), JSONL)
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m av_clipboard_lib', description=__doc__.splitlines()[0])
+    parser.add_argument('direction', choices=(EXPORT, IMPORT),
+                        help='export clipboard strings to FORMAT, or import them back from it')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=(JSONL, CSV, COLUMNAR),
+                        help='guessed from the suffix of the file that is not clipboard strings, jsonl otherwise')
+    parser.add_argument('--workers', type=int, help='worker processes, one per core by default, 1 for none')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='bytes of input per task')
+    parser.add_argument('--strict', action='store_true',
+                        help='reject malformed clipboard strings, and notes AV would reject')
+    parser.add_argument('--errors', help='write failed lines here instead of stderr')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or _guess_format(args.direction == EXPORT and args.output or args.input)
+    errors = args.errors and open(args.errors, 'w') or sys.stderr
+    try:
+        summary = convert_file(
+            args.input, args.output, args.direction, fmt, args.workers, args.chunk_size, args.strict,
+            errors, not args.quiet and sys.stderr or None,
+        )
+    finally:
+        if errors is not sys.stderr:
+            errors.close()
+
+    if not args.quiet:
+        print(f'{summary.converted} converted, {summary.failed} failed in {summary.seconds:.2f} s', file=sys.stderr)
+    return summary.failed and 1 or 0
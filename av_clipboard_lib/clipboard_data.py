@@ -1,137 +1,496 @@
-from io import BytesIO
-from itertools import groupby
-from operator import attrgetter
-from typing import List, Union
+from itertools import compress, groupby
+from operator import attrgetter, ne
+from struct import error as StructError
+from typing import Iterator, List, Optional, TextIO, Tuple, Union
 
-from attr import attrs
+from attr import attrib, attrs
 
-from av_clipboard_lib.av_objects import NoteType, STRUCTURE_REGISTRY, StructureType, decode_next_note, \
-    decode_next_structure
-from av_clipboard_lib.base85 import decode_dwords_from_base85, encode_dwords_to_base85
-from av_clipboard_lib.base_types import STRUCT_BYTE
-from av_clipboard_lib.varint import decode_next_varint, encode_varint
+from av_clipboard_lib.av_objects import NoteType, STRUCTURE_REGISTRY, StructureType, decode_note_from, \
+    decode_structure_from, decode_structures_from
+from av_clipboard_lib.base85 import decode_dwords_from_base85, encode_dwords_to_base85, \
+    iter_decode_dwords_from_base85, splice_base85
+from av_clipboard_lib.base_types import STRUCT_BYTE, decode_via_buffer
+from av_clipboard_lib.chord_copy import ChordCopy
+from av_clipboard_lib.checked_decoding import ClipboardDecodeError, check_consumed, check_note_count, \
+    decode_varint_checked
+from av_clipboard_lib.containers import NOTE_ORDER, STRUCTURE_ORDER, is_presorted, presorted
+from av_clipboard_lib.note_array import NoteArray
+from av_clipboard_lib.structure_array import StructureArray
+from av_clipboard_lib.validation import check_notes
+from av_clipboard_lib.varint import decode_varint_from, encode_varint
 
 
-@attrs(auto_attribs=True)
+def _note_transform(name: str):
+    """Make a copy method that applies the `NoteArray` transform `name` and returns a new copy."""
+    transform = getattr(NoteArray, name)
+
+    def method(self, *args):
+        return self.from_note_array(transform(self.to_note_array(), *args))
+
+    method.__name__ = name
+    method.__doc__ = transform.__doc__
+    return method
+
+
+@attrs(auto_attribs=True, slots=True)
 class RowCopy:
     objects: List[NoteType]
+    _last_encoding: Optional[tuple] = attrib(default=None, init=False, eq=False, repr=False)
+
+    @classmethod
+    def from_note_array(cls, notes: NoteArray):
+        return cls(notes.to_objects())
+
+    def to_note_array(self) -> NoteArray:
+        return NoteArray.from_objects(self.objects, False)
 
     @classmethod
-    def decode(cls, data: BytesIO):
-        count = decode_next_varint(data)
+    def from_chord_copy(cls, chords: ChordCopy):
+        return cls(chords.to_objects())
+
+    def to_chord_copy(self) -> ChordCopy:
+        return ChordCopy.from_objects(self.objects)
+
+    shifted = _note_transform('shifted')
+    scaled = _note_transform('scaled')
+    remapped = _note_transform('remapped')
+    mirrored = _note_transform('mirrored')
+
+    decode = decode_via_buffer
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int, strict: bool = False):
+        count, offset = _decode_note_count(buffer, offset, strict)
+
+        objects = []
+        append = objects.append
+        try:
+            for _ in range(count):
+                note, offset = decode_note_from(buffer, offset, False, strict)
+                append(note)
+        except (IndexError, StructError):
+            if not strict:
+                raise
+            raise ClipboardDecodeError('Payload ends in the middle of a note', offset) from None
 
-        return cls([
-            decode_next_note(data, False)
-            for _ in range(count)
-        ])
+        return cls(presorted(objects, NOTE_ORDER)), offset
 
     @property
     def sorted_objects(self):
-        return sorted(self.objects, key=attrgetter('order_tuple'))
+        if is_presorted(self.objects):
+            return self.objects
+        return sorted(self.objects, key=NOTE_ORDER)
 
-    @property
-    def encoded(self):
-        buffer = BytesIO()
+    def freeze(self) -> 'CopySnapshot':
+        return CopySnapshot.of(self)
 
-        buffer.write(b'\x00')
-        buffer.write(encode_varint(len(self.objects)))
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield the encoded copy piece by piece"""
+        yield b'\x00'
+        yield encode_varint(len(self.objects))
         for datum in self.sorted_objects:
-            buffer.write(datum.encoded)
+            yield datum.encoded
 
-        return buffer.getvalue()
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
 
 
-@attrs(auto_attribs=True)
+@attrs(auto_attribs=True, slots=True)
 class TimeCopy:
     objects: List[NoteType]
+    _last_encoding: Optional[tuple] = attrib(default=None, init=False, eq=False, repr=False)
 
     @classmethod
-    def decode(cls, data: BytesIO):
-        count = decode_next_varint(data)
+    def from_note_array(cls, notes: NoteArray):
+        return cls(notes.to_objects())
+
+    def to_note_array(self) -> NoteArray:
+        return NoteArray.from_objects(self.objects, True)
+
+    shifted = _note_transform('shifted')
+    scaled = _note_transform('scaled')
+    remapped = _note_transform('remapped')
+    mirrored = _note_transform('mirrored')
+
+    decode = decode_via_buffer
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int, strict: bool = False):
+        count, offset = _decode_note_count(buffer, offset, strict)
+
+        objects = []
+        append = objects.append
+        try:
+            for _ in range(count):
+                note, offset = decode_note_from(buffer, offset, True, strict)
+                append(note)
+        except (IndexError, StructError):
+            if not strict:
+                raise
+            raise ClipboardDecodeError('Payload ends in the middle of a note', offset) from None
 
-        return cls([
-            decode_next_note(data, True)
-            for _ in range(count)
-        ])
+        return cls(presorted(objects, NOTE_ORDER)), offset
 
     @property
     def sorted_objects(self):
-        return sorted(self.objects, key=attrgetter('order_tuple'))
+        if is_presorted(self.objects):
+            return self.objects
+        return sorted(self.objects, key=NOTE_ORDER)
 
-    @property
-    def encoded(self):
-        buffer = BytesIO()
+    def freeze(self) -> 'CopySnapshot':
+        return CopySnapshot.of(self)
 
-        buffer.write(b'\x01')
-        buffer.write(encode_varint(len(self.objects)))
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield the encoded copy piece by piece"""
+        yield b'\x01'
+        yield encode_varint(len(self.objects))
         for datum in self.sorted_objects:
-            buffer.write(datum.encoded)
+            yield datum.encoded
 
-        return buffer.getvalue()
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
 
 
-@attrs(auto_attribs=True)
+@attrs(auto_attribs=True, slots=True)
 class StructureCopy:
     objects: List[StructureType]
+    _last_encoding: Optional[tuple] = attrib(default=None, init=False, eq=False, repr=False)
+
+    decode = decode_via_buffer
 
     @classmethod
-    def decode(cls, data: BytesIO):
+    def decode_from(cls, buffer, offset: int, strict: bool = False):
+        decode_count = strict and decode_varint_checked or decode_varint_from
         objects = []
-        count = decode_next_varint(data)
+        count, offset = decode_count(buffer, offset)
         while count > 0:
-            kind, = STRUCT_BYTE.unpack(data.read(1))
-            for _ in range(count):
-                objects.append(decode_next_structure(data, kind))
-            count = decode_next_varint(data)
-        return cls(objects)
+            if strict and offset >= len(buffer):
+                raise ClipboardDecodeError('Payload ends before the kind of a structure group', offset)
+            kind = buffer[offset]
+            offset += 1
+            group, offset = decode_structures_from(buffer, offset, kind, count, strict)
+            objects.extend(group)
+            count, offset = decode_count(buffer, offset)
+        return cls(presorted(objects, STRUCTURE_ORDER)), offset
 
     @property
     def sorted_objects(self):
-        return sorted(self.objects, key=lambda x: (STRUCTURE_REGISTRY[x.__class__], x.position))
+        if is_presorted(self.objects):
+            return self.objects
+        return sorted(self.objects, key=STRUCTURE_ORDER)
 
-    @property
-    def encoded(self):
-        buffer = BytesIO()
+    def freeze(self) -> 'CopySnapshot':
+        return CopySnapshot.of(self)
+
+    def shifted(self, offset: int) -> 'StructureCopy':
+        """Return a copy with every structure moved `offset` rows later."""
+        return StructureCopy(StructureArray.from_objects(self.objects).shifted(offset).to_objects())
 
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield the encoded copy piece by piece, one group of same kind structures at a time"""
         objects = self.sorted_objects
-        object_groups = groupby(objects, key=lambda x: STRUCTURE_REGISTRY[x.__class__])
+        object_groups = groupby(objects, key=attrgetter('KIND'))
 
         for kind, group_objects in object_groups:
             group_objects = [*group_objects]
-            buffer.write(encode_varint(len(group_objects)))
-            buffer.write(STRUCT_BYTE.pack(kind))
-            for datum in group_objects:
-                buffer.write(datum.encoded)
-        buffer.write(STRUCT_BYTE.pack(0))
+            yield encode_varint(len(group_objects))
+            yield STRUCT_BYTE.pack(kind)
+            yield STRUCTURE_REGISTRY[kind].encode_group(group_objects)
+        yield STRUCT_BYTE.pack(0)
 
-        return buffer.getvalue()
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
 
 
 CopyType = Union[RowCopy, TimeCopy, StructureCopy]
 
 
-def parse_av_clipboard_data(data: str) -> CopyType:
-    """Transform valid AV clipboard `data` into a specific copy object."""
+@attrs(auto_attribs=True, slots=True, frozen=True, cache_hash=True)
+class CopySnapshot:
+    """Immutable form of a copy, made by `freeze` and turned back into an editable copy by `thaw`.
+
+    A snapshot only keeps the encoded copy and its clipboard text, so it can be shared between threads
+    and used as a dict key; its hash is computed once and producing it again returns `text` as is.
+    """
+    copy_type: type
+    encoded: bytes
+    text: str = attrib(eq=False, repr=False)
+
+    @classmethod
+    def of(cls, copy: CopyType):
+        encoded, text = _encode_reusing(copy)
+        header = type(copy) is StructureCopy and 'ArrowVortex:tempo:' or 'ArrowVortex:notes:'
+        return cls(type(copy), encoded, header + text)
+
+    def freeze(self) -> 'CopySnapshot':
+        return self
+
+    def thaw(self) -> CopyType:
+        """Decode a new copy, which can be edited without affecting the snapshot"""
+        # Note copies start with their time flag, which their type already tells.
+        copy, _ = self.copy_type.decode_from(self.encoded, self.copy_type is not StructureCopy and 1 or 0)
+        return copy
+
+    def iter_encoded(self) -> Iterator[bytes]:
+        yield self.encoded
+
+
+def _encoded_pieces(copy: CopyType) -> List[bytes]:
+    return [*copy.iter_encoded()]
+
+
+def _encode_reusing(copy: CopyType) -> Tuple[bytes, str]:
+    """Payload of `copy` and its base85 text, only encoding again what changed since the last call.
+
+    Notes keep their encoded bytes until edited, and copies keep the pieces of their last payload with its text.
+    Pieces shared at the start and at the end of both payloads bound the range that goes through base85 again.
+    The copy state is read and replaced as a whole, so copies shared between threads stay consistent.
+    """
+    pieces = _encoded_pieces(copy)
+    data = b''.join(pieces)
+    last = copy._last_encoding
+    if last is None:
+        text = encode_dwords_to_base85(data)
+    else:
+        last_pieces, last_size, last_text = last
+        shared = min(len(pieces), len(last_pieces))
+        head = next(compress(range(shared), map(ne, pieces, last_pieces)), shared)
+        tail = next(compress(range(shared - head), map(ne, reversed(pieces), reversed(last_pieces))), shared - head)
+        start = sum(map(len, pieces[:head]))
+        end = len(data) - sum(map(len, pieces[len(pieces) - tail:]))
+        text = splice_base85(last_text, data, start, end, len(data) - last_size)
+
+    copy._last_encoding = pieces, len(data), text
+    return data, text
+
+
+def _decode_note_count(buffer, offset: int, strict: bool):
+    if not strict:
+        return decode_varint_from(buffer, offset)
+    count, offset = decode_varint_checked(buffer, offset)
+    check_note_count(buffer, offset, count)
+    return count, offset
+
+
+def _decode_av_clipboard_payload(data: str) -> memoryview:
+    if not data.startswith(('ArrowVortex:notes:', 'ArrowVortex:tempo:')):
+        raise ValueError('Argument is not AV clipboard data')
+
+    return memoryview(decode_dwords_from_base85(data[18:]))
+
+
+def parse_av_clipboard_data(data: str, strict: bool = False) -> CopyType:
+    """Transform valid AV clipboard `data` into a specific copy object.
+
+    With `strict`, malformed data raises `ClipboardDecodeError` with the offset of the problem in the payload,
+    instead of whatever the lenient decoding runs into.
+    """
+    is_note_data = data.startswith('ArrowVortex:notes:')
+    data = _decode_av_clipboard_payload(data)
+    if not is_note_data:
+        copy, offset = StructureCopy.decode_from(data, 0, strict)
+    elif strict and (not len(data) or data[0] > 1):
+        raise ClipboardDecodeError('Note payload does not start with a time flag', 0)
+    else:
+        copy, offset = (data[0] and TimeCopy or RowCopy).decode_from(data, 1, strict)
+
+    if strict:
+        check_consumed(data, offset)
+    return copy
+
+
+def parse_av_clipboard_notes(data: str) -> NoteArray:
+    """Transform valid AV clipboard note `data` into columnar `NoteArray` without creating note objects."""
+    if not data.startswith('ArrowVortex:notes:'):
+        raise ValueError('Argument is not AV clipboard note data')
+
+    data = _decode_av_clipboard_payload(data)
+    notes, _ = NoteArray.decode_from(data, 1, bool(data[0]))
+    return notes
+
+
+def parse_av_clipboard_chords(data: str) -> ChordCopy:
+    """Transform valid AV clipboard row copy `data` into a `ChordCopy` without creating tap objects."""
+    if not data.startswith('ArrowVortex:notes:'):
+        raise ValueError('Argument is not AV clipboard note data')
+
+    data = _decode_av_clipboard_payload(data)
+    if data[0]:
+        raise ValueError('Chord copies only hold row based notes')
+    chords, _ = ChordCopy.decode_from(data, 1)
+    return chords
+
+
+def _decode_byte_from(buffer, offset: int):
+    return buffer[offset], offset + 1
+
+
+class _ChunkReader:
+    """Decode values one after another from a window over lazily produced byte `chunks`.
+
+    A decoder that runs off the window, or reaches its very end, is retried once more data is appended,
+    so only the bytes of the value being decoded have to be kept around.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b''
+        self.offset = 0
+        self.exhausted = False
+
+    def _refill(self) -> bool:
+        if not self.exhausted:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+            else:
+                self.buffer = self.buffer[self.offset:] + chunk
+                self.offset = 0
+
+        return not self.exhausted
+
+    def decode(self, decode_from, *args):
+        result, = self.decode_many(decode_from, 1, *args)
+        return result
+
+    def decode_many(self, decode_from, count: int, *args) -> list:
+        """Decode `count` consecutive values, as many of them as the current window holds at a time."""
+        results = []
+        append = results.append
+
+        while len(results) < count:
+            buffer, offset = self.buffer, self.offset
+            end = len(buffer)
+            try:
+                for _ in range(count - len(results)):
+                    result, next_offset = decode_from(buffer, offset, *args)
+                    if next_offset >= end and not self.exhausted:
+                        break
+                    append(result)
+                    offset = next_offset
+            except (IndexError, StructError):
+                if self.exhausted:
+                    raise
+
+            self.offset = offset
+            if len(results) < count:
+                self._refill()
+
+        return results
+
+
+def _iter_notes(reader: _ChunkReader):
+    is_time = bool(reader.decode(_decode_byte_from))
+    count = reader.decode(decode_varint_from)
+    for _ in range(count):
+        yield reader.decode(decode_note_from, is_time)
+
+
+def _iter_structures(reader: _ChunkReader):
+    count = reader.decode(decode_varint_from)
+    while count > 0:
+        kind = reader.decode(_decode_byte_from)
+        for _ in range(count):
+            yield reader.decode(decode_structure_from, kind)
+        count = reader.decode(decode_varint_from)
+
+
+def iter_av_clipboard_objects(data: str, chunk_size: int = 4096) -> Iterator[Union[NoteType, StructureType]]:
+    """Lazily decode the notes or structures of valid AV clipboard `data`, one at a time.
+
+    The payload is converted from base85 `chunk_size` characters at a time as the objects are consumed.
+    """
     is_note_data = data.startswith('ArrowVortex:notes:')
     is_tempo_data = data.startswith('ArrowVortex:tempo:')
     if not (is_note_data or is_tempo_data):
         raise ValueError('Argument is not AV clipboard data')
 
-    data = data[18:]
-    data = decode_dwords_from_base85(data)
-    data = BytesIO(data)
+    reader = _ChunkReader(iter_decode_dwords_from_base85(data, 18, chunk_size))
+    return is_note_data and _iter_notes(reader) or _iter_structures(reader)
+
+
+def parse_av_clipboard_data_chunked(data: str, chunk_size: int = 1 << 16) -> CopyType:
+    """Same as `parse_av_clipboard_data`, but in a single pass that decodes base85 `chunk_size` characters at a time.
+
+    Objects are decoded from each chunk as soon as it is converted, so neither the expanded base85 text
+    nor the whole binary payload is ever held in memory.
+    """
+    is_note_data = data.startswith('ArrowVortex:notes:')
+    is_tempo_data = data.startswith('ArrowVortex:tempo:')
+    if not (is_note_data or is_tempo_data):
+        raise ValueError('Argument is not AV clipboard data')
+
+    reader = _ChunkReader(iter_decode_dwords_from_base85(data, 18, chunk_size))
 
     if is_note_data:
-        is_time_based = bool(*STRUCT_BYTE.unpack(data.read(1)))
-        return is_time_based and TimeCopy.decode(data) or RowCopy.decode(data)
-    return StructureCopy.decode(data)
+        is_time_based = bool(reader.decode(_decode_byte_from))
+        count = reader.decode(decode_varint_from)
+        objects = reader.decode_many(decode_note_from, count, is_time_based)
+        return (is_time_based and TimeCopy or RowCopy)(presorted(objects, NOTE_ORDER))
+
+    objects = []
+    count = reader.decode(decode_varint_from)
+    while count > 0:
+        kind = reader.decode(_decode_byte_from)
+        objects.extend(reader.decode_many(decode_structure_from, count, kind))
+        count = reader.decode(decode_varint_from)
+    return StructureCopy(presorted(objects, STRUCTURE_ORDER))
+
+
+def write_av_clipboard_data(elmns: Union[CopyType, CopySnapshot, NoteArray, StructureArray, ChordCopy], sink: TextIO,
+                            chunk_size: int = 1 << 16):
+    """Write the AV clipboard data of `elmns` to the text stream `sink`.
+
+    The payload is encoded and converted to base85 in DWORD aligned pieces of about `chunk_size` bytes,
+    so the full payload and its text never exist at once. The output is the same as `produce_av_clipboard_data`.
+    """
+    if type(elmns) is CopySnapshot:
+        sink.write(elmns.text)
+        return
+
+    if type(elmns) in {RowCopy, TimeCopy, NoteArray, ChordCopy}:
+        sink.write('ArrowVortex:notes:')
+    else:
+        sink.write('ArrowVortex:tempo:')
+
+    pending = bytearray()
+    for piece in elmns.iter_encoded():
+        pending += piece
+        if len(pending) >= chunk_size:
+            aligned = len(pending) - len(pending) % 4
+            sink.write(encode_dwords_to_base85(bytes(pending[:aligned])))
+            del pending[:aligned]
+
+    # The last piece may end mid-DWORD, it gets the usual trailing padding treatment.
+    sink.write(encode_dwords_to_base85(bytes(pending)))
 
 
-def produce_av_clipboard_data(elmns: CopyType) -> str:
-    """Converts valid `elmns` into AV clipboard data"""
+def produce_av_clipboard_data(elmns: Union[CopyType, CopySnapshot, NoteArray, StructureArray, ChordCopy],
+                              validate: bool = False) -> str:
+    """Converts valid `elmns` into AV clipboard data
+
+    With `validate`, notes are checked with `check_notes` first and ValueError is raised if any would be rejected.
+    """
 
     typ = type(elmns)
-    if typ in {RowCopy, TimeCopy}:
-        return f'ArrowVortex:notes:{encode_dwords_to_base85(elmns.encoded)}'
+    if typ is CopySnapshot:
+        if validate and elmns.copy_type is not StructureCopy:
+            check_notes(elmns.thaw())
+        return elmns.text
+
+    if validate and typ is ChordCopy:
+        check_notes(elmns.to_note_array())
+    elif validate and typ in {RowCopy, TimeCopy, NoteArray}:
+        check_notes(elmns)
+    if typ in {NoteArray, StructureArray, ChordCopy}:
+        encoded = encode_dwords_to_base85(elmns.encoded)
+    else:
+        _, encoded = _encode_reusing(elmns)
+
+    if typ in {RowCopy, TimeCopy, NoteArray, ChordCopy}:
+        return f'ArrowVortex:notes:{encoded}'
     else:
-        return f'ArrowVortex:tempo:{encode_dwords_to_base85(elmns.encoded)}'
+        return f'ArrowVortex:tempo:{encoded}'
@@ -0,0 +1,192 @@
+"""Binary columnar form of copies, to be memory mapped instead of parsed again.
+
+A columnar file is a header followed by fixed-width little endian columns, each starting on an 8 byte boundary:
+
+- note copies: `starts`, `ends` (DOUBLE for time copies, QWORD for row copies), `columns`, `kinds` (BYTE)
+- structure copies: the three `values` (DOUBLE), `rows` (DWORD), label offsets (count + 1 DWORDs),
+  `kinds` (BYTE), then the string heap holding the messages of labels
+
+Loading wraps the columns in memoryviews of the file, so nothing is decoded and no object is created
+until a note or a structure is asked for.
+"""
+import mmap
+import sys
+from array import array
+from collections.abc import Sequence
+from struct import Struct
+from typing import Union
+
+from av_clipboard_lib.clipboard_data import CopyType, RowCopy, StructureCopy, TimeCopy, parse_av_clipboard_data, \
+    produce_av_clipboard_data
+from av_clipboard_lib.note_array import NoteArray
+from av_clipboard_lib.structure_array import StructureArray, VALUE_COLUMNS
+
+MAGIC = b'AVCF'
+VERSION = 1
+
+ROW_NOTES = 0
+TIME_NOTES = 1
+STRUCTURES = 2
+
+# magic, version, kind of copy, object count, string heap size
+_HEADER = Struct('<4sHBxQQ')
+_ALIGNMENT = 8
+
+ColumnarType = Union[NoteArray, StructureArray]
+
+
+def _padding(size: int) -> bytes:
+    return bytes(-size % _ALIGNMENT)
+
+
+def _column_bytes(column, typecode: str) -> bytes:
+    if sys.byteorder == 'little':
+        return memoryview(column).tobytes()
+
+    column = array(typecode, column)
+    column.byteswap()
+    return column.tobytes()
+
+
+def _load_column(view: memoryview, typecode: str):
+    if sys.byteorder == 'little':
+        return view.cast(typecode)
+
+    # Big endian hosts cannot use the file as is, they get a swapped copy of the column.
+    column = array(typecode, view.tobytes())
+    column.byteswap()
+    return column
+
+
+class _StringHeap(Sequence):
+    """Read-only sequence of the strings stored back to back in `heap`, the i-th one ending at `offsets[i + 1]`."""
+    __slots__ = ('offsets', 'heap')
+
+    def __init__(self, offsets, heap: memoryview):
+        self.offsets = offsets
+        self.heap = heap
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('string heap index out of range')
+        return self.heap[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('ascii')
+
+
+def to_columnar(elmns: Union[CopyType, ColumnarType]) -> ColumnarType:
+    """Convert a copy to its array form, arrays are returned as they are."""
+    if isinstance(elmns, (NoteArray, StructureArray)):
+        return elmns
+    if isinstance(elmns, StructureCopy):
+        return StructureArray.from_objects(elmns.objects)
+    return elmns.to_note_array()
+
+
+def from_columnar(elmns: ColumnarType) -> CopyType:
+    """Convert an array form back to a copy of objects."""
+    if isinstance(elmns, StructureArray):
+        return StructureCopy(elmns.to_objects())
+    return (elmns.is_time and TimeCopy or RowCopy).from_note_array(elmns)
+
+
+def dumps_columnar(elmns: Union[CopyType, ColumnarType]) -> bytes:
+    """Serialize `elmns` to the columnar format."""
+    elmns = to_columnar(elmns)
+    pieces = []
+
+    def add(piece: bytes):
+        pieces.append(piece)
+        pieces.append(_padding(len(piece)))
+
+    if isinstance(elmns, NoteArray):
+        kind = elmns.is_time and TIME_NOTES or ROW_NOTES
+        heap = b''
+        position_code = elmns.is_time and 'd' or 'Q'
+        add(_column_bytes(elmns.starts, position_code))
+        add(_column_bytes(elmns.ends, position_code))
+        add(_column_bytes(elmns.columns, 'B'))
+        add(_column_bytes(elmns.kinds, 'B'))
+    else:
+        kind = STRUCTURES
+        messages = [message.encode('ascii') for message in elmns.messages]
+        heap = b''.join(messages)
+        offsets = array('I', [0])
+        for message in messages:
+            offsets.append(offsets[-1] + len(message))
+
+        for column in elmns.values:
+            add(_column_bytes(column, 'd'))
+        add(_column_bytes(elmns.rows, 'I'))
+        add(_column_bytes(offsets, 'I'))
+        add(_column_bytes(elmns.kinds, 'B'))
+        pieces.append(heap)
+
+    header = _HEADER.pack(MAGIC, VERSION, kind, len(elmns), len(heap))
+    return b''.join((header, _padding(len(header)), *pieces))
+
+
+def loads_columnar(buffer) -> ColumnarType:
+    """Wrap columnar data in an array form whose columns are views of `buffer`."""
+    view = memoryview(buffer)
+    if len(view) < _HEADER.size:
+        raise ValueError('Columnar data is too short to have a header')
+
+    magic, version, kind, count, heap_size = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f'Not columnar data, magic is {magic!r}')
+    if version != VERSION:
+        raise ValueError(f'Unsupported columnar data version {version}')
+    if kind not in {ROW_NOTES, TIME_NOTES, STRUCTURES}:
+        raise ValueError(f'Unknown kind of copy {kind}')
+
+    offset = _HEADER.size + len(_padding(_HEADER.size))
+
+    def take(typecode: str, length: int = count):
+        nonlocal offset
+        size = length * array(typecode).itemsize
+        if offset + size > len(view):
+            raise ValueError('Columnar data is truncated')
+        column = _load_column(view[offset:offset + size], typecode)
+        offset += size + len(_padding(size))
+        return column
+
+    if kind != STRUCTURES:
+        position_code = kind == TIME_NOTES and 'd' or 'Q'
+        starts, ends = take(position_code), take(position_code)
+        columns, kinds = take('B'), take('B')
+        return NoteArray(kind == TIME_NOTES, columns, kinds, starts, ends)
+
+    values = [take('d') for _ in range(VALUE_COLUMNS)]
+    rows = take('I')
+    offsets = take('I', count + 1)
+    kinds = take('B')
+    if offset + heap_size > len(view):
+        raise ValueError('Columnar data is truncated')
+    heap = view[offset:offset + heap_size]
+    return StructureArray(kinds, rows, values, _StringHeap(offsets, heap))
+
+
+def save_columnar(elmns: Union[CopyType, ColumnarType], path: str):
+    with open(path, 'wb') as file:
+        file.write(dumps_columnar(elmns))
+
+
+def load_columnar(path: str) -> ColumnarType:
+    """Memory map the columnar file at `path`, the mapping lives as long as the returned columns."""
+    with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return loads_columnar(mapping)
+
+
+def columnar_from_clipboard(data: str) -> bytes:
+    """Convert AV clipboard data to the columnar format."""
+    return dumps_columnar(parse_av_clipboard_data(data))
+
+
+def columnar_to_clipboard(buffer) -> str:
+    """Convert columnar data back to AV clipboard data, encoding straight from the columns."""
+    return produce_av_clipboard_data(loads_columnar(buffer))
@@ -0,0 +1,200 @@
+from bisect import bisect_left, bisect_right
+from collections.abc import MutableSequence
+from itertools import compress, repeat
+from operator import attrgetter, lt
+from typing import Callable, Iterable, Optional
+
+from av_clipboard_lib.av_objects import edit_stamp
+
+NOTE_ORDER = attrgetter('order_tuple')
+STRUCTURE_ORDER = attrgetter('KIND', 'position')
+_EDITED_AT = attrgetter('_edited_at')
+
+
+class PresortedList(list):
+    """List of objects that were in sorted order as of `sorted_at`, the `edit_stamp` when that was checked.
+
+    Any change to the list itself forgets that, and so does any later edit of a structure, so copies can trust it
+    and skip sorting. Notes remember when they were last edited, so after note edits only the edited notes are
+    compared with their neighbours under `key`.
+    """
+    sorted_at: Optional[int] = None
+    key: Optional[Callable] = None
+
+    def _forget_order(self):
+        self.sorted_at = None
+
+    def __setitem__(self, index, value):
+        self._forget_order()
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._forget_order()
+        super().__delitem__(index)
+
+    def __iadd__(self, other):
+        self._forget_order()
+        return super().__iadd__(other)
+
+    def __imul__(self, other):
+        self._forget_order()
+        return super().__imul__(other)
+
+    def append(self, value):
+        self._forget_order()
+        super().append(value)
+
+    def extend(self, values):
+        self._forget_order()
+        super().extend(values)
+
+    def insert(self, index, value):
+        self._forget_order()
+        super().insert(index, value)
+
+    def pop(self, index=-1):
+        self._forget_order()
+        return super().pop(index)
+
+    def remove(self, value):
+        self._forget_order()
+        super().remove(value)
+
+    def clear(self):
+        self._forget_order()
+        super().clear()
+
+    def reverse(self):
+        self._forget_order()
+        super().reverse()
+
+    def sort(self, *args, **kwargs):
+        self._forget_order()
+        super().sort(*args, **kwargs)
+
+    @property
+    def is_sorted(self) -> bool:
+        sorted_at = self.sorted_at
+        if sorted_at is None:
+            return False
+        stamp = edit_stamp()
+        if sorted_at != stamp:
+            if self.key is not NOTE_ORDER or not self._edits_kept_order(sorted_at):
+                self.sorted_at = None
+                return False
+            self.sorted_at = stamp
+        return True
+
+    def _edits_kept_order(self, since: int) -> bool:
+        key, last = self.key, len(self) - 1
+        edited = compress(range(len(self)), map(lt, repeat(since), map(_EDITED_AT, self)))
+        for index in edited:
+            current = key(self[index])
+            if index and current < key(self[index - 1]) or index < last and key(self[index + 1]) < current:
+                return False
+        return True
+
+
+def is_presorted(objects) -> bool:
+    """Whether `objects` is known to be in order without looking at it."""
+    return isinstance(objects, SortedObjects) or isinstance(objects, PresortedList) and objects.is_sorted
+
+
+def presorted(objects: list, key: Callable) -> list:
+    """Wrap decoded `objects` in a `PresortedList`, flagged as sorted if their keys never decrease."""
+    objects = PresortedList(objects)
+    keys = map(key, objects)
+    previous = next(keys, None)
+    for current in keys:
+        if current < previous:
+            return objects
+        previous = current
+
+    objects.sorted_at = edit_stamp()
+    objects.key = key
+    return objects
+
+
+class SortedObjects(MutableSequence):
+    """Always sorted sequence of notes or structures, with bisect based insertion, removal and range queries.
+
+    Inserting ignores the requested index and puts the object at its place in the order, after equal ones.
+    Editing an object held here is noticed through `edit_stamp` and the order is restored on next use.
+    """
+
+    def __init__(self, objects: Iterable = (), key: Callable = NOTE_ORDER):
+        self._key = key
+        self._objects = [*objects]
+        self._keys = []
+        self._sorted_at = None
+
+    def _ensure_sorted(self):
+        stamp = edit_stamp()
+        if self._sorted_at != stamp:
+            self._objects.sort(key=self._key)
+            self._keys = [*map(self._key, self._objects)]
+            self._sorted_at = stamp
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __getitem__(self, index):
+        self._ensure_sorted()
+        return self._objects[index]
+
+    def __iter__(self):
+        self._ensure_sorted()
+        return iter(self._objects)
+
+    def __setitem__(self, index, value):
+        """Replace the object at `index`, or the objects in a slice with those of `value`, keeping the order."""
+        values = [*value] if isinstance(index, slice) else [value]
+        del self[index]
+        for value in values:
+            self.add(value)
+
+    def __delitem__(self, index):
+        self._ensure_sorted()
+        del self._objects[index]
+        del self._keys[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (SortedObjects, list)):
+            return [*self] == [*other]
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({[*self]!r})'
+
+    def insert(self, index, value):
+        self.add(value)
+
+    def add(self, value):
+        self._ensure_sorted()
+        key = self._key(value)
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._objects.insert(index, value)
+
+    def remove(self, value):
+        self._ensure_sorted()
+        key = self._key(value)
+        for index in range(bisect_left(self._keys, key), bisect_right(self._keys, key)):
+            if self._objects[index] == value:
+                del self._objects[index]
+                del self._keys[index]
+                return
+        raise ValueError(f'{value!r} is not in {self.__class__.__name__}')
+
+    def index_range(self, start: tuple, stop: tuple) -> range:
+        """Indices of the objects whose key is at least `start` and below `stop`, both key prefixes."""
+        self._ensure_sorted()
+        return range(bisect_left(self._keys, start), bisect_left(self._keys, stop))
+
+    def irange(self, start: tuple, stop: tuple) -> list:
+        """Objects whose key is at least `start` and below `stop`.
+
+        Bounds are key prefixes, e.g. `(RowPosition(0),)` to `(RowPosition(48),)` selects the notes of the first beat.
+        """
+        indices = self.index_range(start, stop)
+        return self._objects[indices.start:indices.stop]
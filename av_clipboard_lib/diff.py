@@ -0,0 +1,134 @@
+"""Structural diffs between two copies of the same type.
+
+A patch lists operations against the sorted objects of the source copy, in order of `index`:
+an insert puts its object right before the source object at `index`, a delete drops that object
+and a modification replaces it. Both making and applying a patch are a single merge walk.
+
+Encoded, a patch is the copy type byte, the operation count as a varint, then each operation as a varint
+of its code and the index delta from the previous operation, followed by the encoded object if it has one.
+"""
+from typing import List, Optional, Tuple
+
+from attr import attrs
+
+from av_clipboard_lib.av_objects import decode_note_from, decode_structure_from
+from av_clipboard_lib.base_types import STRUCT_BYTE, decode_via_buffer
+from av_clipboard_lib.clipboard_data import CopyType, RowCopy, StructureCopy, TimeCopy
+from av_clipboard_lib.containers import NOTE_ORDER, STRUCTURE_ORDER, presorted
+from av_clipboard_lib.varint import decode_varint_from, encode_varint
+
+INSERT = 0
+DELETE = 1
+MODIFY = 2
+
+_COPY_TYPES = (RowCopy, TimeCopy, StructureCopy)
+
+# code, index in the sorted source objects, object inserted or replacing the source one
+Operation = Tuple[int, int, Optional[object]]
+
+
+def _order_of(copy_type: type):
+    return copy_type is StructureCopy and STRUCTURE_ORDER or NOTE_ORDER
+
+
+@attrs(auto_attribs=True, slots=True)
+class Patch:
+    copy_type: type
+    operations: List[Operation]
+
+    def __len__(self):
+        return len(self.operations)
+
+    def iter_encoded(self):
+        """Yield the encoded patch piece by piece"""
+        is_structure = self.copy_type is StructureCopy
+        yield STRUCT_BYTE.pack(_COPY_TYPES.index(self.copy_type))
+        yield encode_varint(len(self.operations))
+
+        previous = 0
+        for code, index, obj in self.operations:
+            yield encode_varint((index - previous) << 2 | code)
+            previous = index
+            if code != DELETE:
+                if is_structure:
+                    yield STRUCT_BYTE.pack(obj.KIND)
+                yield obj.encoded
+
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
+
+    decode = decode_via_buffer
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int):
+        copy_type = _COPY_TYPES[buffer[offset]]
+        count, offset = decode_varint_from(buffer, offset + 1)
+
+        operations = []
+        index = 0
+        for _ in range(count):
+            value, offset = decode_varint_from(buffer, offset)
+            code, index = value & 0b11, index + (value >> 2)
+            if code == DELETE:
+                obj = None
+            elif copy_type is StructureCopy:
+                obj, offset = decode_structure_from(buffer, offset + 1, buffer[offset])
+            else:
+                obj, offset = decode_note_from(buffer, offset, copy_type is TimeCopy)
+            operations.append((code, index, obj))
+
+        return cls(copy_type, operations), offset
+
+
+def diff_copies(source: CopyType, target: CopyType) -> Patch:
+    """Make the patch turning `source` into `target`, in linear time when both are already sorted."""
+    if type(source) is not type(target):
+        raise ValueError(f'Cannot diff a {type(source).__name__} against a {type(target).__name__}')
+
+    key = _order_of(type(source))
+    old, new = source.sorted_objects, target.sorted_objects
+    operations = []
+    i = j = 0
+    while i < len(old) and j < len(new):
+        old_key, new_key = key(old[i]), key(new[j])
+        if old_key == new_key:
+            if old[i] != new[j]:
+                operations.append((MODIFY, i, new[j]))
+            i += 1
+            j += 1
+        elif old_key < new_key:
+            operations.append((DELETE, i, None))
+            i += 1
+        else:
+            operations.append((INSERT, i, new[j]))
+            j += 1
+
+    operations.extend((DELETE, index, None) for index in range(i, len(old)))
+    operations.extend((INSERT, len(old), obj) for obj in new[j:])
+    return Patch(type(source), operations)
+
+
+def apply_patch(source: CopyType, patch: Patch) -> CopyType:
+    """Return a new copy made of `source` with the operations of `patch` applied.
+
+    `source` is left as is, though the new copy shares its unchanged objects with it.
+    """
+    if type(source) is not patch.copy_type:
+        raise ValueError(f'Cannot apply a {patch.copy_type.__name__} patch to a {type(source).__name__}')
+
+    old = source.sorted_objects
+    objects = []
+    position = 0
+    for code, index, obj in patch.operations:
+        if index < position or index > len(old) or code != INSERT and index == len(old):
+            raise ValueError(f'Patch operation at {index} does not fit the copy')
+        objects.extend(old[position:index])
+        position = index
+        if code != INSERT:
+            position += 1
+        if code != DELETE:
+            objects.append(obj)
+    objects.extend(old[position:])
+
+    return patch.copy_type(presorted(objects, _order_of(patch.copy_type)))
@@ -0,0 +1,188 @@
+"""Opt-in timing of the parse and produce stages.
+
+Nothing here runs until an `Instrumentation` is enabled: only then are the instrumented versions of
+the codec functions swapped into their modules, and the originals are put back once the last one is
+disabled.
+
+>>> import av_clipboard_lib as av
+>>> with Instrumentation() as instrumentation:
+...     _ = av.parse_av_clipboard_data('ArrowVortex:notes:!!WE\\'!<<-/!Xo&G!uM')
+>>> instrumentation.stats['decode']['objects']
+6
+"""
+import sys
+import threading
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Optional
+
+import av_clipboard_lib
+from av_clipboard_lib import clipboard_data, varint
+from av_clipboard_lib.clipboard_data import RowCopy, StructureCopy, TimeCopy
+
+_COPY_TYPES = (RowCopy, TimeCopy, StructureCopy)
+
+_lock = threading.Lock()
+_active = []
+_originals = []
+_local = threading.local()
+
+
+def _new_stage() -> dict:
+    return {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'objects': 0}
+
+
+def _record(stage: str, seconds: float, byte_count: int = 0, object_count: int = 0):
+    records = [instrumentation.stats for instrumentation in _active]
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        records.append(current['stages'])
+
+    for stats in records:
+        entry = stats.setdefault(stage, _new_stage())
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['bytes'] += byte_count
+        entry['objects'] += object_count
+
+
+def _timed(stage: str, function: Callable, measure: Callable) -> Callable:
+    """Wrap `function` to record its time under `stage`, `measure(args, result)` gives (bytes, objects)."""
+
+    @wraps(function)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        result = function(*args, **kwargs)
+        _record(stage, perf_counter() - start, *measure(args, result))
+        return result
+
+    return timed
+
+
+def _operation(name: str, function: Callable) -> Callable:
+    """Wrap a top level `function` so that each call is reported to the callbacks with its own stages."""
+
+    @wraps(function)
+    def operation(*args, **kwargs):
+        outer = getattr(_local, 'current', None)
+        _local.current = current = {'operation': name, 'stages': {}}
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            current['seconds'] = perf_counter() - start
+            _local.current = outer
+            _record(name, current['seconds'])
+            for instrumentation in [*_active]:
+                if instrumentation.callback is not None:
+                    instrumentation.callback(current)
+
+    return operation
+
+
+def _decoded_measure(args, result):
+    copy, offset = result
+    return offset - args[2], len(copy.objects)
+
+
+def _patch(owner, name: str, replacement):
+    _originals.append((owner, name, owner.__dict__[name]))
+    setattr(owner, name, replacement)
+
+
+def _patch_everywhere(function: Callable, replacement):
+    """Patch `function` in every module of the library, including those that imported it by name."""
+    for module in [*sys.modules.values()]:
+        if getattr(module, '__name__', '').partition('.')[0] != av_clipboard_lib.__name__:
+            continue
+        for name in [name for name, value in vars(module).items() if value is function]:
+            _patch(module, name, replacement)
+
+
+def _install(detailed: bool):
+    _patch(clipboard_data, 'decode_dwords_from_base85', _timed(
+        'base85_decode', clipboard_data.decode_dwords_from_base85, lambda args, result: (len(result), 0),
+    ))
+    _patch(clipboard_data, 'encode_dwords_to_base85', _timed(
+        'base85_encode', clipboard_data.encode_dwords_to_base85, lambda args, result: (len(args[0]), 0),
+    ))
+    _patch(clipboard_data, 'splice_base85', _timed(
+        'base85_encode', clipboard_data.splice_base85, lambda args, result: (len(args[1]), 0),
+    ))
+
+    _patch(clipboard_data, '_encoded_pieces', _timed(
+        'encode', clipboard_data._encoded_pieces, lambda args, result: (sum(map(len, result)), len(args[0].objects)),
+    ))
+
+    for copy_type in _COPY_TYPES:
+        _patch(copy_type, 'decode_from', classmethod(_timed(
+            'decode', copy_type.decode_from.__func__, _decoded_measure,
+        )))
+        _patch(copy_type, 'encoded', property(_timed(
+            'encode', copy_type.encoded.fget, lambda args, result: (len(result), len(args[0].objects)),
+        )))
+
+    if detailed:
+        _patch_everywhere(varint.decode_varint_from, _timed(
+            'varint_decode', varint.decode_varint_from, lambda args, result: (result[1] - args[1], 0),
+        ))
+        _patch(clipboard_data, 'decode_note_from', _timed(
+            'note_decode', clipboard_data.decode_note_from, lambda args, result: (result[1] - args[1], 1),
+        ))
+        _patch(clipboard_data, 'decode_structures_from', _timed(
+            'structure_decode', clipboard_data.decode_structures_from,
+            lambda args, result: (result[1] - args[1], len(result[0])),
+        ))
+
+    parse = _operation('parse', clipboard_data.parse_av_clipboard_data)
+    produce = _operation('produce', clipboard_data.produce_av_clipboard_data)
+    for owner in (clipboard_data, av_clipboard_lib):
+        _patch(owner, 'parse_av_clipboard_data', parse)
+        _patch(owner, 'produce_av_clipboard_data', produce)
+
+
+def _reinstall():
+    """Restore the original functions, then instrument them again if anything is still enabled."""
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+
+    if _active:
+        _install(any(instrumentation.detailed for instrumentation in _active))
+
+
+class Instrumentation:
+    """Per stage wall time, byte and object counts of `parse_av_clipboard_data` and `produce_av_clipboard_data`.
+
+    Use it as a context manager, or call `enable` and `disable`. `stats` maps each stage to its totals;
+    `callback`, if given, receives a dict of every parse or produce call with the stages it went through.
+    `detailed` also times every varint, note and structure group decoded, at a noticeable cost.
+    Instrumentation is process wide: calls from every thread are recorded while it is enabled.
+    """
+
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None, detailed: bool = False):
+        self.callback = callback
+        self.detailed = detailed
+        self.stats = {}
+
+    def enable(self):
+        with _lock:
+            if self not in _active:
+                _active.append(self)
+                _reinstall()
+
+    def disable(self):
+        with _lock:
+            if self in _active:
+                _active.remove(self)
+                _reinstall()
+
+    def reset(self):
+        self.stats = {}
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
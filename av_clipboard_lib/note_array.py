@@ -0,0 +1,220 @@
+from array import array
+from typing import Iterable, Iterator, List, Sequence
+
+from attr import attrib, attrs
+
+from av_clipboard_lib.av_objects import Fake, LongNote, Mine, NOTE_REGISTRY, NoteType
+from av_clipboard_lib.base_types import RowPosition, STRUCT_BYTE, STRUCT_DOUBLE, TimePosition
+from av_clipboard_lib.transforms import affine_positions, mirror_columns, remap_columns
+from av_clipboard_lib.varint import decode_varint_from, encode_varint
+
+# Taps carry no kind byte on the wire, they are stored under this value instead.
+TAP_KIND = 0xFF
+
+_KIND_TO_CLASS = {
+    TAP_KIND if kind is None else kind: cls
+    for kind, cls in NOTE_REGISTRY.items()
+    if not isinstance(kind, type)
+}
+_CLASS_TO_KIND = {cls: kind for kind, cls in _KIND_TO_CLASS.items()}
+_KNOWN_KINDS = bytes(sorted(_KIND_TO_CLASS))
+_LONG_KINDS = frozenset(kind for kind, cls in _KIND_TO_CLASS.items() if issubclass(cls, LongNote))
+# Notes that are never stepped on, so they take no part in chords.
+_UNSTEPPED_KINDS = frozenset((_CLASS_TO_KIND[Mine], _CLASS_TO_KIND[Fake]))
+
+
+def _position_typecode(is_time: bool) -> str:
+    return is_time and 'd' or 'Q'
+
+
+@attrs(auto_attribs=True, slots=True)
+class NoteArray:
+    """Columnar storage of the notes of a row or time copy.
+
+    Every note takes one slot in each of the `columns`, `kinds`, `starts` and `ends` arrays.
+    Instant notes have equal start and end, taps have `TAP_KIND` as their kind.
+    """
+    is_time: bool
+    columns: array = attrib(factory=lambda: array('B'))
+    kinds: array = attrib(factory=lambda: array('B'))
+    starts: array = None
+    ends: array = None
+
+    def __attrs_post_init__(self):
+        if self.starts is None:
+            self.starts = array(_position_typecode(self.is_time))
+        if self.ends is None:
+            self.ends = array(_position_typecode(self.is_time))
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> NoteType:
+        position_of = self.is_time and TimePosition.of or RowPosition.of
+        return _KIND_TO_CLASS[self.kinds[index]].from_triplet(
+            self.columns[index],
+            position_of(self.starts[index]),
+            position_of(self.ends[index]),
+        )
+
+    def __iter__(self) -> Iterator[NoteType]:
+        return map(self.__getitem__, range(len(self)))
+
+    def append(self, note: NoteType):
+        if isinstance(note, LongNote):
+            start, end = note.start_position, note.end_position
+        else:
+            start = end = note.position
+
+        self.columns.append(note.column)
+        self.kinds.append(_CLASS_TO_KIND[note.__class__])
+        if self.is_time:
+            self.starts.append(start.seconds)
+            self.ends.append(end.seconds)
+        else:
+            self.starts.append(start.row)
+            self.ends.append(end.row)
+
+    @classmethod
+    def from_objects(cls, objects: Iterable[NoteType], is_time: bool):
+        notes = cls(is_time)
+        for note in objects:
+            notes.append(note)
+        return notes
+
+    def to_objects(self) -> List[NoteType]:
+        return [*self]
+
+    def check_kinds(self):
+        """Raise ValueError if a note has an unknown kind, which decoding into columns does not check."""
+        unknown = bytes(self.kinds).translate(None, _KNOWN_KINDS)
+        if unknown:
+            raise ValueError(f'Unknown note kind {unknown[0]}')
+
+    def _transformed(self, columns=None, starts=None, ends=None) -> 'NoteArray':
+        """Return new notes made of the given columns and copies of the others."""
+        typecode = _position_typecode(self.is_time)
+        if columns is None:
+            columns = array('B', self.columns)
+        if starts is None:
+            starts = array(typecode, self.starts)
+        if ends is None:
+            ends = array(typecode, self.ends)
+        return NoteArray(self.is_time, columns, array('B', self.kinds), starts, ends)
+
+    def shifted(self, offset) -> 'NoteArray':
+        """Return the notes moved `offset` rows or seconds later."""
+        return self._transformed(
+            starts=affine_positions(self.starts, offset=offset),
+            ends=affine_positions(self.ends, offset=offset),
+        )
+
+    def scaled(self, factor: float) -> 'NoteArray':
+        """Return the notes with every position multiplied by `factor`, rows are rounded."""
+        return self._transformed(
+            starts=affine_positions(self.starts, factor),
+            ends=affine_positions(self.ends, factor),
+        )
+
+    def remapped(self, mapping: Sequence[int]) -> 'NoteArray':
+        """Return the notes with each column `c` moved to `mapping[c]`."""
+        return self._transformed(columns=remap_columns(self.columns, mapping))
+
+    def mirrored(self, column_count: int) -> 'NoteArray':
+        """Return the notes flipped left to right, out of `column_count` columns."""
+        return self._transformed(columns=mirror_columns(self.columns, column_count))
+
+    @property
+    def is_sorted(self) -> bool:
+        """Whether the notes are already ordered by position, then column."""
+        starts, columns = self.starts, self.columns
+        for index in range(1, len(self)):
+            previous, current = starts[index - 1], starts[index]
+            if previous > current or previous == current and columns[index - 1] > columns[index]:
+                return False
+        return True
+
+    @property
+    def sorted_indices(self):
+        if self.is_sorted:
+            return range(len(self))
+
+        starts, columns = self.starts, self.columns
+        return sorted(range(len(self)), key=lambda index: (starts[index], columns[index]))
+
+    @property
+    def sorted_objects(self) -> List[NoteType]:
+        return [self[index] for index in self.sorted_indices]
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int, is_time: bool):
+        """Decode a note copy body at `offset` in `buffer` straight into columns."""
+        count, offset = decode_varint_from(buffer, offset)
+
+        notes = cls(is_time)
+        columns, kinds, starts, ends = notes.columns, notes.kinds, notes.starts, notes.ends
+
+        for _ in range(count):
+            first_byte = buffer[offset]
+            if is_time:
+                start, = STRUCT_DOUBLE.unpack_from(buffer, offset + 1)
+                offset += 9
+            else:
+                start, offset = decode_varint_from(buffer, offset + 1)
+
+            if first_byte & 0x80:
+                if is_time:
+                    end, = STRUCT_DOUBLE.unpack_from(buffer, offset)
+                    offset += 8
+                else:
+                    end, offset = decode_varint_from(buffer, offset)
+                kind = buffer[offset]
+                offset += 1
+                if kind not in _LONG_KINDS:
+                    end = start
+                columns.append(first_byte ^ 0x80)
+            else:
+                end = start
+                kind = TAP_KIND
+                columns.append(first_byte)
+
+            kinds.append(kind)
+            starts.append(start)
+            ends.append(end)
+
+        return notes, offset
+
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield the encoded copy piece by piece"""
+        is_time = self.is_time
+        columns, kinds, starts, ends = self.columns, self.kinds, self.starts, self.ends
+
+        if is_time:
+            encode_position = STRUCT_DOUBLE.pack
+        else:
+            varints = {}
+
+            def encode_position(row):
+                encoded = varints.get(row)
+                if encoded is None:
+                    encoded = varints[row] = encode_varint(row)
+                return encoded
+
+        yield STRUCT_BYTE.pack(is_time)
+        yield encode_varint(len(self))
+        for index in self.sorted_indices:
+            kind = kinds[index]
+            start = encode_position(starts[index])
+            if kind == TAP_KIND:
+                yield STRUCT_BYTE.pack(columns[index])
+                yield start
+                continue
+
+            yield STRUCT_BYTE.pack(columns[index] | 0x80)
+            yield start
+            yield kind in _LONG_KINDS and encode_position(ends[index]) or start
+            yield STRUCT_BYTE.pack(kind)
+
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+from typing import Union
+
+from attr import attrib, attrs
+
+from av_clipboard_lib.clipboard_data import CopyType, RowCopy, StructureCopy, TimeCopy, parse_av_clipboard_data
+from av_clipboard_lib.columnar_file import to_columnar
+from av_clipboard_lib.containers import NOTE_ORDER, STRUCTURE_ORDER, presorted
+from av_clipboard_lib.note_array import NoteArray
+from av_clipboard_lib.structure_array import StructureArray
+
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+def _digest(data: str) -> bytes:
+    return blake2b(data.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def _snapshot_size(snapshot: Union[NoteArray, StructureArray]) -> int:
+    if isinstance(snapshot, NoteArray):
+        columns = (snapshot.columns, snapshot.kinds, snapshot.starts, snapshot.ends)
+        return sum(len(column) * column.itemsize for column in columns)
+
+    columns = (snapshot.kinds, snapshot.rows, *snapshot.values)
+    return sum(len(column) * column.itemsize for column in columns) + sum(map(len, snapshot.messages))
+
+
+def _restore(snapshot: Union[NoteArray, StructureArray]) -> CopyType:
+    if isinstance(snapshot, StructureArray):
+        return StructureCopy(presorted(snapshot.to_objects(), STRUCTURE_ORDER))
+    return (snapshot.is_time and TimeCopy or RowCopy)(presorted(snapshot.to_objects(), NOTE_ORDER))
+
+
+@attrs(auto_attribs=True, slots=True)
+class ParseCache:
+    """Bounded cache of `parse_av_clipboard_data` results, keyed by a digest of the clipboard text.
+
+    Results are kept as columnar snapshots and every lookup builds new objects from them,
+    so editing a returned copy never shows in later lookups. Least recently used snapshots are evicted
+    once they take more than `max_bytes` in total, a snapshot bigger than that is never kept.
+    """
+    max_bytes: int = DEFAULT_MAX_BYTES
+    hits: int = attrib(default=0, init=False)
+    misses: int = attrib(default=0, init=False)
+    evictions: int = attrib(default=0, init=False)
+    size: int = attrib(default=0, init=False)
+    _entries: OrderedDict = attrib(factory=OrderedDict, init=False, repr=False)
+    _lock: Lock = attrib(factory=Lock, init=False, repr=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, data: str):
+        return _digest(data) in self._entries
+
+    def parse(self, data: str) -> CopyType:
+        """Same as `parse_av_clipboard_data(data)`, but decodes each distinct `data` only once while cached."""
+        key = _digest(data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is not None:
+            return _restore(entry[0])
+
+        copy = parse_av_clipboard_data(data)
+        snapshot = to_columnar(copy)
+        self._store(key, snapshot, _snapshot_size(snapshot))
+        return copy
+
+    def _store(self, key: bytes, snapshot, size: int):
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+
+            self._entries[key] = snapshot, size
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.size,
+        }
@@ -0,0 +1,140 @@
+"""Search of chord sequences, such as `[12][23][14]`, in the notes of a copy.
+
+Notes are grouped into chords: one column bitmask per position that has a note to step on,
+which leaves out mines and fakes. A sequence matches consecutive chords, empty rows between them do not count.
+Windows of chords are found through a polynomial rolling hash, and every hit is checked against the chords.
+"""
+from array import array
+from itertools import groupby
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+from attr import attrib, attrs
+
+from av_clipboard_lib.base_types import PositionValue, RowPosition, TimePosition
+from av_clipboard_lib.clipboard_data import RowCopy, TimeCopy
+from av_clipboard_lib.note_array import NoteArray, _UNSTEPPED_KINDS
+
+_MODULUS = (1 << 61) - 1
+_BASE = 1000003
+
+Chords = Sequence[Iterable[int]]
+
+
+def chord_mask(columns: Iterable[int]) -> int:
+    """Bitmask with a bit set for each of `columns`."""
+    mask = 0
+    for column in columns:
+        mask |= 1 << column
+    return mask
+
+
+def _mask_columns(mask: int) -> List[int]:
+    return [column for column in range(mask.bit_length()) if mask >> column & 1]
+
+
+def _hash_of(masks: Iterable[int]) -> int:
+    value = 0
+    for mask in masks:
+        value = (value * _BASE + mask) % _MODULUS
+    return value
+
+
+@attrs(auto_attribs=True, slots=True)
+class ChordIndex:
+    """Chords of a copy, `masks[i]` being the chord at `positions[i]`, ready for any number of searches."""
+    is_time: bool
+    positions: array
+    masks: List[int]
+    column_count: int
+    _prefix: List[int] = attrib(init=False, repr=False)
+    _windows: Dict[int, Dict[int, List[int]]] = attrib(factory=dict, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        prefix = [0]
+        for mask in self.masks:
+            prefix.append((prefix[-1] * _BASE + mask) % _MODULUS)
+        self._prefix = prefix
+
+    def __len__(self):
+        return len(self.masks)
+
+    @classmethod
+    def from_notes(cls, notes: Union[RowCopy, TimeCopy, NoteArray], column_count: int = None):
+        """Index the chords of `notes`, in linear time unless the notes have to be sorted first.
+
+        `column_count` bounds transpositions and mirroring, it is one more than the highest column by default.
+        """
+        if not isinstance(notes, NoteArray):
+            notes = notes.to_note_array()
+
+        columns, kinds, starts = notes.columns, notes.kinds, notes.starts
+        positions = array(notes.is_time and 'd' or 'Q')
+        masks = []
+        stepped = (index for index in notes.sorted_indices if kinds[index] not in _UNSTEPPED_KINDS)
+        for start, indices in groupby(stepped, key=starts.__getitem__):
+            positions.append(start)
+            masks.append(chord_mask(columns[index] for index in indices))
+
+        if column_count is None:
+            column_count = max(masks, default=0).bit_length()
+        return cls(notes.is_time, positions, masks, column_count)
+
+    def _starts_of(self, masks: Tuple[int, ...]) -> List[int]:
+        length = len(masks)
+        if length == 0 or length > len(self.masks):
+            return []
+
+        windows = self._windows.get(length)
+        if windows is None:
+            windows = self._windows[length] = {}
+            prefix, shift = self._prefix, pow(_BASE, length, _MODULUS)
+            for start in range(len(self.masks) - length + 1):
+                value = (prefix[start + length] - prefix[start] * shift) % _MODULUS
+                windows.setdefault(value, []).append(start)
+
+        own = self.masks
+        return [
+            start for start in windows.get(_hash_of(masks), ())
+            if own[start:start + length] == [*masks]
+        ]
+
+    def _variants(self, masks: Tuple[int, ...], transpose: bool, mirror: bool):
+        variants = {masks}
+        highest = max(masks, default=0).bit_length()
+        if mirror and highest <= self.column_count:
+            width = self.column_count
+            variants.add(tuple(
+                chord_mask(width - 1 - column for column in _mask_columns(mask))
+                for mask in masks
+            ))
+        if transpose:
+            for variant in [*variants]:
+                lowest = min((column for mask in variant for column in _mask_columns(mask)), default=0)
+                highest = max(variant, default=0).bit_length()
+                for shift in range(-lowest, self.column_count - highest + 1):
+                    variants.add(tuple(mask << shift if shift >= 0 else mask >> -shift for mask in variant))
+        return variants
+
+    def find(self, chords: Chords, transpose: bool = False, mirror: bool = False) -> List[PositionValue]:
+        """Positions of the first chord of every occurrence of `chords`, a sequence of sets of columns.
+
+        With `transpose` the sequence also matches when moved left or right as a whole,
+        with `mirror` it also matches flipped left to right.
+        """
+        masks = tuple(map(chord_mask, chords))
+        starts = set()
+        for variant in self._variants(masks, transpose, mirror):
+            starts.update(self._starts_of(variant))
+
+        position_of = self.is_time and TimePosition.of or RowPosition.of
+        return [position_of(self.positions[start]) for start in sorted(starts)]
+
+
+def find_in_corpus(indexes: Iterable[ChordIndex], chords: Chords, transpose: bool = False, mirror: bool = False) \
+        -> List[Tuple[int, PositionValue]]:
+    """Occurrences of `chords` across `indexes`, as pairs of the number of the index and the position."""
+    return [
+        (number, position)
+        for number, index in enumerate(indexes)
+        for position in index.find(chords, transpose, mirror)
+    ]
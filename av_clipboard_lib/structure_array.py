@@ -0,0 +1,134 @@
+from array import array
+from itertools import groupby
+from typing import Iterable, Iterator, List, Sequence
+
+from attr import attrib, attrs
+
+from av_clipboard_lib.av_objects import Label, STRUCTURE_REGISTRY, StructureType
+from av_clipboard_lib.base_types import RowPosition, STRUCT_BYTE, STRUCT_DWORD
+from av_clipboard_lib.transforms import affine_positions
+from av_clipboard_lib.varint import encode_varint
+
+# Speed has the most fields of all fixed-size structures.
+VALUE_COLUMNS = 3
+
+_FIELD_TYPES = {
+    kind: tuple(code == 'd' and float or int for code in cls.FIELD_CODES)
+    for kind, cls in STRUCTURE_REGISTRY.items()
+    if not isinstance(kind, type) and cls is not Label
+}
+
+
+@attrs(auto_attribs=True, slots=True)
+class StructureArray:
+    """Columnar storage of the structures of a structure copy.
+
+    Every structure takes one slot in the `kinds`, `rows` and `messages` columns and in each of the `values`
+    columns. Fields are stored in declaration order, unused values are zero and only labels have a message.
+    """
+    kinds: array = attrib(factory=lambda: array('B'))
+    rows: array = attrib(factory=lambda: array('I'))
+    values: List[array] = attrib(factory=lambda: [array('d') for _ in range(VALUE_COLUMNS)])
+    messages: Sequence[str] = attrib(factory=list)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> StructureType:
+        kind = self.kinds[index]
+        cls = STRUCTURE_REGISTRY[kind]
+        position = RowPosition.of(self.rows[index])
+        if cls is Label:
+            return cls(position, self.messages[index])
+
+        return cls(position, *(
+            field_type(column[index])
+            for field_type, column in zip(_FIELD_TYPES[kind], self.values)
+        ))
+
+    def __iter__(self) -> Iterator[StructureType]:
+        return map(self.__getitem__, range(len(self)))
+
+    def append(self, structure: StructureType):
+        self.kinds.append(structure.KIND)
+        self.rows.append(structure.position.row)
+        if isinstance(structure, Label):
+            fields = ()
+            self.messages.append(structure.message)
+        else:
+            fields = [getattr(structure, name) for name in structure.FIELDS]
+            self.messages.append('')
+
+        for index, column in enumerate(self.values):
+            column.append(fields[index] if index < len(fields) else 0)
+
+    @classmethod
+    def from_objects(cls, objects: Iterable[StructureType]):
+        structures = cls()
+        for structure in objects:
+            structures.append(structure)
+        return structures
+
+    def to_objects(self) -> List[StructureType]:
+        return [*self]
+
+    def shifted(self, offset: int) -> 'StructureArray':
+        """Return the structures moved `offset` rows later."""
+        return StructureArray(
+            array('B', self.kinds),
+            affine_positions(self.rows, offset=offset),
+            [array('d', column) for column in self.values],
+            [*self.messages],
+        )
+
+    @property
+    def is_sorted(self) -> bool:
+        """Whether the structures are already ordered by kind, then row."""
+        kinds, rows = self.kinds, self.rows
+        for index in range(1, len(self)):
+            previous, current = kinds[index - 1], kinds[index]
+            if previous > current or previous == current and rows[index - 1] > rows[index]:
+                return False
+        return True
+
+    @property
+    def sorted_indices(self):
+        if self.is_sorted:
+            return range(len(self))
+
+        kinds, rows = self.kinds, self.rows
+        return sorted(range(len(self)), key=lambda index: (kinds[index], rows[index]))
+
+    @property
+    def sorted_objects(self) -> List[StructureType]:
+        return [self[index] for index in self.sorted_indices]
+
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield the encoded copy piece by piece, straight from the columns"""
+        kinds, rows, values, messages = self.kinds, self.rows, self.values, self.messages
+
+        for kind, indices in groupby(self.sorted_indices, key=kinds.__getitem__):
+            indices = [*indices]
+            yield encode_varint(len(indices))
+            yield STRUCT_BYTE.pack(kind)
+
+            cls = STRUCTURE_REGISTRY[kind]
+            if cls is Label:
+                for index in indices:
+                    message = messages[index].encode('ascii')
+                    yield STRUCT_DWORD.pack(rows[index])
+                    yield encode_varint(len(message))
+                    yield message
+                continue
+
+            pack, field_types = cls.STRUCT.pack, _FIELD_TYPES[kind]
+            for index in indices:
+                yield pack(rows[index], *(
+                    field_type(column[index])
+                    for field_type, column in zip(field_types, values)
+                ))
+        yield STRUCT_BYTE.pack(0)
+
+    @property
+    def encoded(self):
+        return b''.join(self.iter_encoded())
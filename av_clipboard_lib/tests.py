@@ -1,11 +1,33 @@
-from io import BytesIO
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
 
-from av_clipboard_lib.av_objects import BPM, Combo, Delay, FakeSegment, Hold, Label, Mine, Roll, Scroll, Speed, Tap, \
-    Ticks, \
+import attr
+import pytest
+
+from av_clipboard_lib import analytics, base85, cli, clipboard_data, varint
+from av_clipboard_lib.batch import parse_many, produce_many
+
+from av_clipboard_lib.av_objects import BPM, Combo, Delay, FakeSegment, Hold, Label, Lift, LongNote, Mine, Roll, \
+    Scroll, Speed, Tap, Ticks, \
     TimeSignature, Warp, \
-    decode_next_note
+    Stop, decode_next_note, decode_note_from, decode_structure_from, decode_structures_from
 from av_clipboard_lib.base_types import RowPosition, TimePosition
-from av_clipboard_lib.clipboard_data import RowCopy, StructureCopy, parse_av_clipboard_data, produce_av_clipboard_data
+from av_clipboard_lib.clipboard_data import RowCopy, StructureCopy, TimeCopy, iter_av_clipboard_objects, \
+    parse_av_clipboard_chords, parse_av_clipboard_data, parse_av_clipboard_data_chunked, parse_av_clipboard_notes, \
+    produce_av_clipboard_data, write_av_clipboard_data
+from av_clipboard_lib.checked_decoding import ClipboardDecodeError
+from av_clipboard_lib.columnar_file import columnar_from_clipboard, columnar_to_clipboard, dumps_columnar, \
+    from_columnar, load_columnar, loads_columnar, save_columnar
+from av_clipboard_lib.containers import SortedObjects, is_presorted
+from av_clipboard_lib.diff import DELETE, INSERT, MODIFY, Patch, apply_patch, diff_copies
+from av_clipboard_lib.instrumentation import Instrumentation
+from av_clipboard_lib.parse_cache import ParseCache
+from av_clipboard_lib.pattern_index import ChordIndex, find_in_corpus
+from av_clipboard_lib.structure_array import StructureArray
+from av_clipboard_lib.timing import TimingMap
+from av_clipboard_lib.validation import COLUMN_OUT_OF_RANGE, DUPLICATE, INSIDE_LONG_NOTE, NoteIssue, \
+    OVERLAPPING_LONG_NOTES, find_note_issues
 
 P = RowPosition(58301)
 P_hex = 'BDC703'
@@ -81,6 +103,59 @@ class TestAVObject:
         )
 
 
+class TestOffsetDecoding:
+    def test_note_from(self):
+        data = bytes.fromhex(f'FF 81 {P_hex} {P_hex} 02 02 {P_hex}')
+        roll, offset = decode_note_from(data, 1, False)
+        assert roll == Roll(column=1, start_position=P, end_position=P)
+        assert decode_note_from(memoryview(data), offset, False) == (Tap(column=2, position=P), len(data))
+
+    def test_structure_from(self):
+        data = bytes.fromhex(f'{PW_hex} 05 {"gamma".encode("ascii").hex()} {PW_hex} {D_hex}')
+        label, offset = decode_structure_from(data, 0, 0x0A)
+        assert label == Label(position=P, message='gamma')
+        assert decode_structure_from(data, offset, 0x00) == (BPM(position=P, bpm=DD), len(data))
+
+    def test_structure_group(self):
+        speeds = [
+            Speed(position=P, ratio=DD, delay=DD, delay_is_time=True),
+            Speed(position=RowPosition(0), ratio=0.5, delay=0.0, delay_is_time=False),
+        ]
+        data = b'\xFF' + Speed.encode_group(speeds)
+        assert Speed.STRUCT.format == '<IddI'
+        assert data[1:] == b''.join(speed.encoded for speed in speeds)
+        assert decode_structures_from(data, 1, 0x07, 2) == (speeds, len(data))
+
+    def test_stream_wrapper_advances(self):
+        stream = make_stream(f'02 {P_hex} 02 {P_hex}')
+        decode_next_note(stream, False)
+        assert stream.tell() == 4
+        assert decode_next_note(stream, False) == Tap(column=2, position=P)
+
+    def test_negative_zero_time(self):
+        copy = TimeCopy([Tap(0, TimePosition.of(0.0)), Tap(1, TimePosition.of(-0.0))])
+        av = produce_av_clipboard_data(copy)
+        assert produce_av_clipboard_data(parse_av_clipboard_data(av)) == av
+        assert TimePosition.of(-0.0).encoded == bytes.fromhex('0000000000000080')
+
+
+STRUCTURE_COPY_HEX = (
+    "4172726f77566f727465783a74656d706f3"
+    "a21575733237a7a3a2d5d33667a7a44456e34282"
+    "c514966452a456c75386862573e75213c592255"
+    "212121452d21212124263b75636d75226f6e572"
+    "7236c6a722a213c6e2c56212123255c21212124"
+    "285e5d343f372e4b42474b555d43477121584a5"
+    "7272121222a706c56592f35292a6c486a62666e"
+    "3b5426337033712121222c422121222a706c565"
+    "92f3523736532343e605a62702f336a34392121"
+    "21242a3a5d554f7234555466394534"
+    "6d5f64213d3d38572121254f6a212121242c59513"
+    "45f282a4362305d4345524a2a2b435c6271436961237"
+    "04345526837403c3c572b46212c523c426c6137"
+)
+
+
 class TestLib:
     def test_av_string_structure(self):
         input_string = (
@@ -118,6 +193,13 @@ class TestLib:
         assert produce_av_clipboard_data(parse_av_clipboard_data(av)) == av
         assert parse_av_clipboard_data(av) == target
 
+    def test_chord_shares_position(self):
+        first, second, *_ = parse_av_clipboard_data(TestNoteArray.TIME_COPY).objects
+        assert first.position is second.position
+        assert not hasattr(first, '__dict__')
+        with pytest.raises(AttributeError):
+            first.position.seconds = 1.0
+
     def test_av_string_note(self):
         input_string = "4172726f77566f727465783a6e6f7465733a21214539254a4d3862594a6d615a40212f2440365e5d3d4b"
         av = bytes.fromhex(input_string).decode('ascii')
@@ -130,3 +212,747 @@ class TestLib:
         ])
         assert produce_av_clipboard_data(parse_av_clipboard_data(av)) == av
         assert parse_av_clipboard_data(av) == target
+
+
+class TestBase85:
+    PAYLOADS = [
+        b'',
+        bytes.fromhex('C9E8C919DC2C7E0E'),
+        bytes(range(256)) * 3 + b'\x00' * 9,
+        b'\x00' * 64 + b'\x01\x02\x03',
+        b'\x00' * 66,
+    ]
+
+    @pytest.mark.skipif(base85.numpy is None, reason='NumPy is not installed')
+    @pytest.mark.parametrize('payload', PAYLOADS)
+    def test_numpy_matches_python(self, payload):
+        text = base85._encode_dwords_to_base85_python(payload)
+        assert base85._encode_dwords_to_base85_numpy(payload) == text
+        assert base85._decode_dwords_from_base85_numpy(text) == payload
+        assert base85._decode_dwords_from_base85_python(text) == payload
+
+
+class TestNoteArray:
+    NOTE_COPY = 'ArrowVortex:notes:!!E9%JM8bYJmaZ@!/$@6^]=K'
+    TIME_COPY = 'ArrowVortex:notes:!<rN(z!!!!"zz!<<*"!!!#W56:fbzi\'.2Az!:W2Tz!!)LQ'
+
+    def test_round_trip(self):
+        for av in (self.NOTE_COPY, self.TIME_COPY):
+            notes = parse_av_clipboard_notes(av)
+            assert notes.to_objects() == parse_av_clipboard_data(av).objects
+            assert produce_av_clipboard_data(notes) == av
+
+    def test_unsorted_encoding(self):
+        copy = TimeCopy(objects=[
+            Roll(column=3, start_position=D, end_position=TimePosition(4.0)),
+            Mine(column=1, position=TimePosition(0.5)),
+            Tap(column=2, position=D),
+            Tap(column=0, position=D),
+        ])
+        notes = copy.to_note_array()
+        assert not notes.is_sorted
+        assert notes.encoded == copy.encoded
+        assert notes.sorted_objects == copy.sorted_objects
+        assert TimeCopy.from_note_array(notes) == copy
+
+
+class TestStreaming:
+    @pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+    def test_matches_parse(self, chunk_size):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        for av in (TestNoteArray.NOTE_COPY, TestNoteArray.TIME_COPY, structure_copy):
+            assert [*iter_av_clipboard_objects(av, chunk_size)] == parse_av_clipboard_data(av).objects
+            assert parse_av_clipboard_data_chunked(av, chunk_size) == parse_av_clipboard_data(av)
+
+    @pytest.mark.parametrize('chunk_size', [1, 6, 1 << 16])
+    def test_write(self, chunk_size):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        copies = [
+            (parse_av_clipboard_data(structure_copy), structure_copy),
+            (parse_av_clipboard_data(TestNoteArray.TIME_COPY), TestNoteArray.TIME_COPY),
+            (parse_av_clipboard_notes(TestNoteArray.NOTE_COPY), TestNoteArray.NOTE_COPY),
+        ]
+        for copy, av in copies:
+            sink = StringIO()
+            write_av_clipboard_data(copy, sink, chunk_size)
+            assert sink.getvalue() == av
+
+    def test_early_exit(self):
+        notes = iter_av_clipboard_objects(TestNoteArray.NOTE_COPY)
+        assert next(notes) == Tap(column=0, position=RowPosition(row=0))
+
+
+class TestBatch:
+    @pytest.mark.parametrize('max_workers', [1, 2])
+    def test_round_trip_in_order(self, max_workers):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        inputs = [TestNoteArray.NOTE_COPY, 'garbage', structure_copy, TestNoteArray.TIME_COPY] * 3
+
+        parsed = parse_many(inputs, max_workers=max_workers, chunk_size=5)
+        assert [result.ok for result in parsed] == [True, False, True, True] * 3
+        assert isinstance(parsed[1].error, ValueError)
+        assert parsed[2].value == parse_av_clipboard_data(structure_copy)
+
+        copies = [result.value for result in parsed if result.ok]
+        produced = produce_many(copies, max_workers=max_workers, chunk_size=2)
+        assert [result.value for result in produced] == [data for data in inputs if data != 'garbage']
+
+    def test_unknown_note_kind(self):
+        # A mine-like note of kind 9, which AV does not have
+        unknown_kind = 'ArrowVortex:notes:' + base85.encode_dwords_to_base85(bytes.fromhex('0001810C0C09'))
+        parsed = parse_many([TestNoteArray.NOTE_COPY, unknown_kind, 'garbage'], max_workers=1)
+        assert [result.ok for result in parsed] == [True, False, False]
+        assert isinstance(parsed[1].error, ValueError)
+        assert parse_many([unknown_kind], max_workers=1, columnar=True)[0].error is not None
+
+    def test_matches_produce(self):
+        structure_copy = parse_av_clipboard_data(bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii'))
+        copies = [
+            parse_av_clipboard_data(TestNoteArray.NOTE_COPY), parse_av_clipboard_data(TestNoteArray.TIME_COPY),
+            structure_copy, parse_av_clipboard_notes(TestNoteArray.TIME_COPY),
+            StructureArray.from_objects(structure_copy.objects),
+        ]
+        copies += [copy.freeze() for copy in copies[:3]]
+        copies.append(parse_av_clipboard_chords(TestNoteArray.NOTE_COPY))
+
+        produced = produce_many(copies, max_workers=1)
+        assert [result.value for result in produced] == [*map(produce_av_clipboard_data, copies)]
+
+        failed, = produce_many([object()], max_workers=1)
+        assert isinstance(failed.error, ValueError)
+
+    def test_columnar(self):
+        result, = parse_many([TestNoteArray.NOTE_COPY], max_workers=1, columnar=True)
+        assert result.value == parse_av_clipboard_notes(TestNoteArray.NOTE_COPY)
+
+
+class TestTiming:
+    # 60 BPM, 90 BPM from row 24 and a 0.75 second stop on row 48, with a 12 rows warp and a delay.
+    TIMING = TimingMap.from_structures([
+        BPM(RowPosition(0), bpm=60.0),
+        BPM(RowPosition(24), bpm=90.0),
+        Stop(RowPosition(48), time=0.75),
+        Warp(RowPosition(96), skipped_rows=12),
+        Delay(RowPosition(144), time=0.5),
+    ])
+
+    def test_row_to_seconds(self):
+        expected = {0: 0.0, 12: 0.25, 24: 0.5, 48: 5 / 6, 60: 1.75, 96: 2.25, 100: 2.25, 108: 2.25, 144: 3.25}
+        for row, seconds in expected.items():
+            assert self.TIMING.row_to_seconds(row) == pytest.approx(seconds)
+            assert self.TIMING.rows_to_seconds([row]) == pytest.approx([seconds])
+
+    def test_seconds_to_row(self):
+        expected = {0.0: 0, 0.25: 12, 1.0: 48, 1.75: 60, 2.25: 108, 3.0: 144, 3.25: 144, 3.5: 162}
+        for seconds, row in expected.items():
+            assert self.TIMING.seconds_to_row(seconds) == pytest.approx(row)
+            assert self.TIMING.seconds_to_rows([seconds]) == pytest.approx([row])
+
+    def test_negative_bpm(self, monkeypatch):
+        # Rows 48 to 72 go back half a second, so 0.75 to 1 seconds are first reached on row 48 and skipped after 72
+        timing = TimingMap.from_structures([
+            BPM(RowPosition(0), bpm=60.0), BPM(RowPosition(48), bpm=-120.0), BPM(RowPosition(72), bpm=60.0),
+        ])
+        seconds = [1.2, 0.5, 0.8, 1.0, 2.0]
+        expected = [93.6, 24.0, 38.4, 84.0, 132.0]
+        assert [*map(timing.seconds_to_row, seconds)] == pytest.approx(expected)
+        assert timing.seconds_to_rows(seconds) == pytest.approx(expected)
+        monkeypatch.setattr('av_clipboard_lib.timing.numpy', None)
+        assert timing.seconds_to_rows(seconds) == pytest.approx(expected)
+
+    def test_copy_conversion(self):
+        rows = RowCopy(objects=[
+            Tap(column=0, position=RowPosition(0)),
+            Hold(column=1, start_position=RowPosition(12), end_position=RowPosition(60)),
+            Mine(column=2, position=RowPosition(144)),
+        ])
+        times = self.TIMING.to_time_copy(rows)
+        assert times.objects[1] == Hold(column=1, start_position=TimePosition(0.25), end_position=TimePosition(1.75))
+        assert self.TIMING.to_row_copy(times) == rows
+
+
+class TestIncrementalEncoding:
+    @staticmethod
+    def make_copy():
+        return RowCopy(objects=[Tap(column=index % 4, position=RowPosition(index * 12)) for index in range(5000)])
+
+    def test_note_forgets_encoding(self):
+        copy = self.make_copy()
+        produce_av_clipboard_data(copy)
+        encoded = [note.encoded for note in copy.objects]
+        assert all(note.encoded is piece for note, piece in zip(copy.objects, encoded))
+
+        copy.objects[100].column = 3
+        produce_av_clipboard_data(copy)
+        changed = [index for index, note in enumerate(copy.objects) if note.encoded is not encoded[index]]
+        assert changed == [100]
+        assert copy.objects[100].encoded == Tap(column=3, position=RowPosition(1200)).encoded
+
+    @pytest.fixture(params=[True, False], ids=['numpy', 'python'])
+    def encoded_payloads(self, request, monkeypatch):
+        if not request.param:
+            monkeypatch.setattr(base85, 'numpy', None)
+        elif base85.numpy is None:
+            pytest.skip('NumPy is not installed')
+        real_encode = base85.encode_dwords_to_base85
+        payloads = []
+
+        def encode(data):
+            payloads.append(data)
+            return real_encode(data)
+
+        monkeypatch.setattr(base85, 'encode_dwords_to_base85', encode)
+        return payloads
+
+    def test_edit_encodes_changed_dwords(self, encoded_payloads):
+        copy = self.make_copy()
+        produce_av_clipboard_data(copy)
+
+        for index in (0, 2500, -1):
+            encoded_payloads.clear()
+            copy.objects[index].column ^= 1
+            produced = produce_av_clipboard_data(copy)
+
+            assert sum(map(len, encoded_payloads)) <= 8
+            assert produced == produce_av_clipboard_data(RowCopy(objects=[*copy.objects]))
+
+    def test_insert_and_remove(self, encoded_payloads):
+        copy = self.make_copy()
+        produce_av_clipboard_data(copy)
+        encoded_payloads.clear()
+
+        # Two taps on row 0 take 4 bytes, so the rest of the payload moves by a whole DWORD.
+        copy.objects[1:1] = [Tap(column=1, position=RowPosition(0)), Tap(column=2, position=RowPosition(0))]
+        produced = produce_av_clipboard_data(copy)
+        assert sum(map(len, encoded_payloads)) <= 16
+        assert produced == produce_av_clipboard_data(RowCopy(objects=[*copy.objects]))
+
+        # A single one does not, everything after it is encoded again.
+        del copy.objects[1]
+        produced = produce_av_clipboard_data(copy)
+        assert produced == produce_av_clipboard_data(RowCopy(objects=[*copy.objects]))
+
+        del copy.objects[100:]
+        assert produce_av_clipboard_data(copy) == produce_av_clipboard_data(RowCopy(objects=[*copy.objects]))
+
+    def test_structure_copy(self):
+        copy = parse_av_clipboard_data(bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii'))
+        produce_av_clipboard_data(copy)
+        copy.objects[-1].message = 'changed'
+        assert produce_av_clipboard_data(copy) == produce_av_clipboard_data(StructureCopy([*copy.objects]))
+
+    def test_shared_between_threads(self):
+        copy = self.make_copy()
+        expected = produce_av_clipboard_data(RowCopy(objects=[*copy.objects]))
+        with ThreadPoolExecutor(4) as executor:
+            produced = [*executor.map(lambda _: produce_av_clipboard_data(copy), range(64))]
+        assert produced == [expected] * 64
+
+
+class TestSortedContainers:
+    def test_decoded_copy_is_presorted(self):
+        copy = parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+        assert copy.sorted_objects is copy.objects
+
+        copy.objects[1].column = 3
+        assert is_presorted(copy.objects)
+
+        copy.objects[0].position = RowPosition(500)
+        assert not is_presorted(copy.objects)
+        assert copy.sorted_objects[-1] is copy.objects[0]
+
+        copy = parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+        copy.objects.append(Tap(column=0, position=RowPosition(0)))
+        assert not is_presorted(copy.objects)
+
+    def test_sorted_objects(self):
+        taps = [Tap(column=column, position=RowPosition(row)) for row in (48, 0, 24) for column in (1, 0)]
+        objects = SortedObjects(taps)
+        assert [*objects] == sorted(taps, key=lambda tap: (tap.position.row, tap.column))
+
+        objects.append(Tap(column=2, position=RowPosition(12)))
+        objects.remove(Tap(column=0, position=RowPosition(0)))
+        assert objects.irange((RowPosition(0),), (RowPosition(48),)) == [
+            Tap(column=1, position=RowPosition(0)),
+            Tap(column=2, position=RowPosition(12)),
+            Tap(column=0, position=RowPosition(24)),
+            Tap(column=1, position=RowPosition(24)),
+        ]
+
+        objects[0].position = RowPosition(96)
+        assert objects[-1] == Tap(column=1, position=RowPosition(96))
+
+        copy = RowCopy(objects)
+        assert copy.sorted_objects is objects
+        assert RowCopy.decode(BytesIO(copy.encoded[1:])).objects == objects
+
+    def test_sorted_objects_slice_assignment(self):
+        objects = SortedObjects(Tap(column=0, position=RowPosition(row)) for row in (0, 24, 48, 72))
+        objects[1:3] = [Tap(column=1, position=RowPosition(96)), Tap(column=1, position=RowPosition(12))]
+
+        assert [(tap.position.row, tap.column) for tap in objects] == [(0, 0), (12, 1), (72, 0), (96, 1)]
+        assert objects.irange((RowPosition(12),), (RowPosition(96),)) == [
+            Tap(column=1, position=RowPosition(12)),
+            Tap(column=0, position=RowPosition(72)),
+        ]
+
+
+class TestInstrumentation:
+    def test_stages(self):
+        calls = []
+        original_parse = clipboard_data.parse_av_clipboard_data
+
+        with Instrumentation(callback=calls.append, detailed=True) as instrumentation:
+            copy = clipboard_data.parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+            clipboard_data.produce_av_clipboard_data(copy)
+
+        assert clipboard_data.parse_av_clipboard_data is original_parse
+        assert [call['operation'] for call in calls] == ['parse', 'produce']
+        assert set(calls[0]['stages']) == {'base85_decode', 'decode', 'note_decode', 'varint_decode'}
+        assert set(calls[1]['stages']) == {'encode', 'base85_encode'}
+
+        stats = instrumentation.stats
+        assert stats['decode']['objects'] == stats['encode']['objects'] == stats['note_decode']['calls'] == 4
+        assert stats['base85_decode']['bytes'] == stats['base85_encode']['bytes'] == len(copy.encoded)
+        assert stats['parse']['calls'] == stats['produce']['calls'] == 1
+        # One varint for the note count, decoded in clipboard_data, and one per note position.
+        assert stats['varint_decode']['calls'] == 8
+        assert clipboard_data.decode_varint_from is varint.decode_varint_from
+
+
+class TestColumnarFile:
+    def test_round_trip(self, tmp_path):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        for av in (TestNoteArray.NOTE_COPY, TestNoteArray.TIME_COPY, structure_copy):
+            path = str(tmp_path / 'copy.avc')
+            save_columnar(parse_av_clipboard_data(av), path)
+            loaded = load_columnar(path)
+            assert from_columnar(loaded) == parse_av_clipboard_data(av)
+            assert produce_av_clipboard_data(loaded) == av
+            assert columnar_to_clipboard(columnar_from_clipboard(av)) == av
+
+    def test_views_and_labels(self):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        structures = loads_columnar(columnar_from_clipboard(structure_copy))
+        assert isinstance(structures, StructureArray)
+        assert isinstance(structures.rows, memoryview)
+        assert structures[-1] == Label(RowPosition(432), 'Fuck me ballsack what is this')
+        assert structures.messages[0] == ''
+
+        unsorted = StructureCopy([Label(RowPosition(4), 'b'), Speed(RowPosition(2), 1.5, 0.25, True)])
+        assert StructureArray.from_objects(unsorted.objects).encoded == unsorted.encoded
+
+    def test_negative_zero_field(self):
+        copy = StructureCopy([Scroll(RowPosition(0), -0.0), Speed(RowPosition(0), -0.0, 0.0, False)])
+        structures = StructureArray.from_objects(copy.objects)
+        assert structures.encoded == copy.encoded
+        assert str(structures[0].ratio) == '-0.0'
+
+    def test_invalid(self):
+        data = dumps_columnar(parse_av_clipboard_data(TestNoteArray.NOTE_COPY))
+        with pytest.raises(ValueError):
+            loads_columnar(b'XXXX' + data[4:])
+        with pytest.raises(ValueError):
+            loads_columnar(data[:-9])
+
+
+class TestParseCache:
+    def test_hits_are_independent(self):
+        cache = ParseCache()
+        first = cache.parse(TestNoteArray.NOTE_COPY)
+        first.objects[0].column = 3
+        del first.objects[1]
+
+        second = cache.parse(TestNoteArray.NOTE_COPY)
+        assert second == parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+        assert is_presorted(second.objects)
+        assert second.objects[0] is not first.objects[0]
+        assert cache.stats == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': cache.size}
+
+    def test_eviction(self):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        sizes = ParseCache()
+        sizes.parse(TestNoteArray.NOTE_COPY)
+        sizes.parse(TestNoteArray.TIME_COPY)
+
+        cache = ParseCache(max_bytes=sizes.size - 1)
+        cache.parse(TestNoteArray.NOTE_COPY)
+        cache.parse(TestNoteArray.TIME_COPY)
+        assert TestNoteArray.TIME_COPY in cache and TestNoteArray.NOTE_COPY not in cache
+        assert cache.evictions == 1 and cache.size < cache.max_bytes
+
+        cache.max_bytes = cache.size
+        assert cache.parse(structure_copy) == parse_av_clipboard_data(structure_copy)
+        assert len(cache) == 1 and cache.misses == 3
+
+
+class TestValidation:
+    NOTES = [
+        Hold(column=0, start_position=RowPosition(0), end_position=RowPosition(48)),
+        Tap(column=0, position=RowPosition(48)),
+        Roll(column=0, start_position=RowPosition(12), end_position=RowPosition(24)),
+        Mine(column=1, position=RowPosition(24)),
+        Tap(column=1, position=RowPosition(24)),
+        Tap(column=9, position=RowPosition(60)),
+        Tap(column=0, position=RowPosition(60)),
+    ]
+
+    def test_issues(self):
+        expected = [
+            NoteIssue(INSIDE_LONG_NOTE, 1, 0),
+            NoteIssue(OVERLAPPING_LONG_NOTES, 2, 0),
+            NoteIssue(DUPLICATE, 4, 3),
+            NoteIssue(COLUMN_OUT_OF_RANGE, 5),
+        ]
+        copy = RowCopy(self.NOTES)
+        assert find_note_issues(copy, column_count=4) == expected
+        assert find_note_issues(copy.to_note_array(), column_count=4) == expected
+        assert find_note_issues(parse_av_clipboard_data(TestNoteArray.TIME_COPY)) == []
+
+    def test_produce(self):
+        with pytest.raises(ValueError, match='inside long note'):
+            produce_av_clipboard_data(RowCopy(self.NOTES[:2]), validate=True)
+        assert produce_av_clipboard_data(RowCopy(self.NOTES[2:4]), validate=True) == \
+            produce_av_clipboard_data(RowCopy(self.NOTES[2:4]))
+
+
+class TestTransforms:
+    @staticmethod
+    def make_notes(count, position_of):
+        notes = []
+        for index in range(count):
+            column, start = index % 4, position_of(index * 12 + index % 3)
+            if index % 5 == 0:
+                notes.append(Hold(column, start, position_of(index * 12 + 30)))
+            elif index % 7 == 0:
+                notes.append(Mine(column, start))
+            else:
+                notes.append(Tap(column, start))
+        return notes
+
+    @staticmethod
+    def loop(notes, column=None, position=None):
+        result = []
+        for note in notes:
+            note = attr.evolve(note)
+            if column is not None:
+                note.column = column(note.column)
+            if position is not None:
+                if isinstance(note, LongNote):
+                    note.start_position = position(note.start_position)
+                    note.end_position = position(note.end_position)
+                else:
+                    note.position = position(note.position)
+            result.append(note)
+        return result
+
+    @pytest.mark.parametrize('count', [10, 200])
+    def test_row_copy(self, count):
+        notes = self.make_notes(count, RowPosition)
+        copy = RowCopy(notes)
+        assert copy.shifted(7).objects == self.loop(notes, position=lambda p: RowPosition(p.row + 7))
+        assert copy.scaled(1.5).objects == self.loop(notes, position=lambda p: RowPosition(round(p.row * 1.5)))
+        assert copy.mirrored(4).objects == self.loop(notes, column=lambda c: 3 - c)
+        assert copy.remapped([0, 2, 4, 6]).objects == self.loop(notes, column=lambda c: c * 2)
+        with pytest.raises(ValueError):
+            copy.shifted(-1)
+        with pytest.raises(ValueError):
+            copy.remapped([1, 0])
+
+    @pytest.mark.parametrize('count', [10, 200])
+    def test_time_copy(self, count):
+        notes = self.make_notes(count, lambda row: TimePosition(row / 48))
+        copy = TimeCopy(notes)
+        assert copy.scaled(1 / 1.5).objects == \
+            self.loop(notes, position=lambda p: TimePosition(p.seconds * (1 / 1.5)))
+        assert copy.shifted(-0.25).objects == self.loop(notes, position=lambda p: TimePosition(p.seconds - 0.25))
+
+    def test_structure_copy(self):
+        copy = parse_av_clipboard_data(bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii'))
+        expected = [
+            attr.evolve(structure, position=RowPosition(structure.position.row + 96))
+            for structure in copy.objects
+        ]
+        assert copy.shifted(96).objects == expected
+
+
+class TestDiff:
+    def test_note_patch(self):
+        source = parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+        objects = [*source.objects]
+        target_objects = [
+            Tap(column=0, position=RowPosition(0)),
+            attr.evolve(objects[0], column=3),
+            *objects[1:3],
+            Hold(column=1, start_position=RowPosition(500), end_position=RowPosition(600)),
+        ]
+        target = RowCopy(target_objects)
+
+        patch = diff_copies(source, target)
+        assert [code for code, _, _ in patch.operations].count(DELETE) >= 1
+        assert apply_patch(source, patch).objects == target.sorted_objects
+        assert source.objects == objects
+
+        decoded = Patch.decode(BytesIO(patch.encoded))
+        assert decoded == patch
+        assert apply_patch(source, decoded) == apply_patch(source, patch)
+        assert len(diff_copies(source, parse_av_clipboard_data(TestNoteArray.NOTE_COPY))) == 0
+
+    def test_structure_patch(self):
+        source = parse_av_clipboard_data(bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii'))
+        target = StructureCopy([BPM(RowPosition(0), 120.0), *source.objects[2:], Label(RowPosition(1), 'new')])
+
+        patch = diff_copies(source, target)
+        assert [code for code, _, _ in patch.operations] == [MODIFY, DELETE, INSERT]
+        assert apply_patch(source, Patch.decode(BytesIO(patch.encoded))).objects == target.sorted_objects
+
+        with pytest.raises(ValueError):
+            diff_copies(source, parse_av_clipboard_data(TestNoteArray.NOTE_COPY))
+
+
+class TestPatternIndex:
+    @staticmethod
+    def make_copy(*chords):
+        return RowCopy([
+            Tap(column=column, position=RowPosition(row * 12))
+            for row, chord in enumerate(chords)
+            for column in chord
+        ])
+
+    def test_find(self):
+        copy = self.make_copy((0, 1), (1, 2), (0, 2), (1, 2), (2, 3), (1, 3), (2, 3), (1, 2), (0, 2))
+        copy.objects.append(Mine(column=3, position=RowPosition(12)))
+        index = ChordIndex.from_notes(copy)
+        assert index.column_count == 4
+
+        assert index.find([(0, 1), (1, 2), (0, 2)]) == [RowPosition(0)]
+        assert index.find([(1, 2), (2, 3), (1, 3)]) == [RowPosition(36)]
+        assert index.find([(0, 1), (1, 2), (0, 2)], transpose=True) == [RowPosition(0), RowPosition(36)]
+        assert index.find([(2, 3), (1, 2), (1, 3)], mirror=True) == [RowPosition(0)]
+        assert index.find([(2, 3), (1, 2), (1, 3)], transpose=True, mirror=True) == [RowPosition(0), RowPosition(36)]
+        assert index.find([(0, 1)] * 20, transpose=True, mirror=True) == []
+
+    def test_corpus(self):
+        indexes = [
+            ChordIndex.from_notes(parse_av_clipboard_notes(TestNoteArray.NOTE_COPY)),
+            ChordIndex.from_notes(parse_av_clipboard_data(TestNoteArray.TIME_COPY)),
+        ]
+        assert find_in_corpus(indexes, [(0,)]) == [(0, RowPosition(0))]
+        assert find_in_corpus(indexes, [(2,), (3,)]) == [(0, RowPosition(96))]
+        assert find_in_corpus(indexes, [(1, 2), (0, 3)]) == [(1, TimePosition(0.5))]
+
+
+class TestAnalytics:
+    @pytest.fixture(params=[True, False], ids=['numpy', 'python'])
+    def use_numpy(self, request, monkeypatch):
+        if not request.param:
+            monkeypatch.setattr(analytics, 'numpy', None)
+
+    @staticmethod
+    def make_copy():
+        # A 16th stream over 0, 1, 2, 3, 0, 1, 2, 3 then a jack on 3 and a [02] chord, with a mine that is not counted
+        objects = [Tap(column=index % 4, position=RowPosition(index * 12)) for index in range(8)]
+        objects += [
+            Tap(column=3, position=RowPosition(96)),
+            Hold(column=0, start_position=RowPosition(144), end_position=RowPosition(192)),
+            Tap(column=2, position=RowPosition(144)),
+            Mine(column=1, position=RowPosition(150)),
+        ]
+        return RowCopy(objects)
+
+    def test_rows(self, use_numpy):
+        copy = self.make_copy()
+        chords = analytics.Chords.of(copy)
+        assert analytics.window_counts(chords, 48)[:3] == [4, 4, 4]
+        assert analytics.density_curve(chords, 48) == [4, 4, 1, 2]
+        assert analytics.column_gaps(chords) == {0: [48.0, 96.0], 1: [48.0], 2: [48.0, 72.0], 3: [48.0, 12.0]}
+
+        report = analytics.chart_report(copy, min_stream=4)
+        assert report == analytics.ChartReport(
+            in_seconds=False, note_count=11, chord_count=10, duration=144.0, window=48,
+            average_density=11 * 48 / 144, peak_density=4, peak_position=0.0, chord_sizes=((1, 9), (2, 1)),
+            jacks=1, streams=1, longest_stream=8,
+        )
+        assert hash(report) == hash(analytics.chart_report(copy, min_stream=4))
+
+    def test_seconds(self, use_numpy):
+        timing = StructureCopy([BPM(RowPosition(0), 120.0), Stop(RowPosition(96), 1.0)])
+        report = analytics.chart_report(self.make_copy(), timing)
+        assert report.in_seconds and report.duration == 2.5
+        assert (report.peak_density, report.peak_position) == (8, 0.0)
+        assert analytics.density_curve(analytics.Chords.of(self.make_copy(), timing)) == [8, 1, 2]
+
+
+    def test_shared_column(self, use_numpy):
+        # The tap and the hold share a column on row 0, which is one column stepped on
+        copy = RowCopy([
+            Tap(0, RowPosition(0)), Hold(0, RowPosition(0), RowPosition(48)), Tap(1, RowPosition(12)),
+        ])
+        report = analytics.chart_report(copy)
+        assert (report.note_count, report.peak_density, report.chord_sizes) == (2, 2, ((1, 2),))
+
+
+class TestSnapshots:
+    def test_freeze_thaw(self):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        for av in (TestNoteArray.NOTE_COPY, TestNoteArray.TIME_COPY, structure_copy):
+            copy = parse_av_clipboard_data(av)
+            snapshot = copy.freeze()
+            assert produce_av_clipboard_data(snapshot) is snapshot.text
+            assert snapshot.text == av
+            assert snapshot.thaw() == copy
+            assert snapshot.freeze() is snapshot
+
+            sink = StringIO()
+            write_av_clipboard_data(snapshot, sink)
+            assert sink.getvalue() == av
+
+    def test_immutable_and_hashable(self):
+        copy = parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+        snapshot = copy.freeze()
+        cache = {snapshot: 'parsed'}
+        assert cache[parse_av_clipboard_data(TestNoteArray.NOTE_COPY).freeze()] == 'parsed'
+        with pytest.raises(attr.exceptions.FrozenInstanceError):
+            snapshot.encoded = b''
+
+        thawed = snapshot.thaw()
+        thawed.objects[0].column = 3
+        copy.objects.pop()
+        assert snapshot.thaw() == parse_av_clipboard_data(TestNoteArray.NOTE_COPY)
+        assert thawed.freeze() != snapshot and copy.freeze() != snapshot
+
+
+class TestCheckedDecoding:
+    def test_valid(self):
+        structure_copy = bytes.fromhex(STRUCTURE_COPY_HEX).decode('ascii')
+        for av in (TestNoteArray.NOTE_COPY, TestNoteArray.TIME_COPY, structure_copy):
+            copy = parse_av_clipboard_data(av, strict=True)
+            assert copy == parse_av_clipboard_data(av)
+            assert is_presorted(copy.objects)
+
+    @pytest.mark.parametrize('kind, payload_hex, offset, message', [
+        ('notes', '00018100', 2, 'ends in the middle of a note'),
+        ('notes', '0003010002', 2, 'declared'),
+        ('notes', '000181000005', 5, 'Unknown note kind 5'),
+        ('notes', '0001808000', 3, 'Overlong varint'),
+        ('notes', '00018118000000', 2, 'ends before it starts'),
+        ('notes', '010100000000000000F0BF', 3, 'negative or NaN'),
+        ('notes', '0101800000000000000040000000000000000000', 2, 'ends before it starts'),
+        ('notes', '00010100FF', 4, 'bytes left'),
+        ('tempo', '010C000000000000', 1, 'Unknown structure kind'),
+        ('tempo', '02000000000000', 2, '2 BPM structures declared'),
+        ('tempo', '010A00000000054142', 2, 'cut short'),
+        ('tempo', '010000000000000000000000F87F00', 2, 'BPM bpm is NaN'),
+    ])
+    def test_malformed(self, kind, payload_hex, offset, message):
+        data = f'ArrowVortex:{kind}:' + base85.encode_dwords_to_base85(bytes.fromhex(payload_hex))
+        with pytest.raises(ClipboardDecodeError, match=message) as error:
+            parse_av_clipboard_data(data, strict=True)
+        assert error.value.offset == offset
+
+    def test_error_pickles(self):
+        error = pickle.loads(pickle.dumps(ClipboardDecodeError('Overlong varint', 3)))
+        assert (str(error), error.offset) == ('Overlong varint at byte 3', 3)
+
+
+class TestChordCopy:
+    COPY = RowCopy(objects=[
+        Tap(0, RowPosition(0)), Tap(1, RowPosition(0)),
+        Hold(3, RowPosition(0), RowPosition(24)),
+        Tap(1, RowPosition(12)), Tap(1, RowPosition(12)), Mine(2, RowPosition(12)),
+        Tap(70, RowPosition(12)),
+        Tap(0, RowPosition(24)), Tap(2, RowPosition(24)),
+    ])
+
+    def test_layout(self):
+        chords = self.COPY.to_chord_copy()
+        assert list(chords.rows) == [0, 12, 24]
+        assert list(chords.masks) == [0b0011, 0b0010, 0b0101]
+        # The hold, the repeated tap, the mine and the tap past the bitmask columns
+        assert len(chords.others) == 4
+        assert len(chords) == len(self.COPY.objects)
+
+    def test_membership(self):
+        chords = self.COPY.to_chord_copy()
+        assert chords.chord_at(24) == 0b0101
+        assert chords.chord_at(36) == 0
+        assert chords.has_tap(0, 1)
+        assert not chords.has_tap(0, 3)
+        assert not chords.has_tap(12, 2)
+
+    def test_round_trip(self):
+        av = produce_av_clipboard_data(self.COPY)
+        chords = parse_av_clipboard_chords(av)
+        assert chords == self.COPY.to_chord_copy()
+        assert RowCopy.from_chord_copy(chords) == self.COPY
+        assert chords.to_note_array().to_objects() == self.COPY.objects
+        assert chords.encoded == self.COPY.encoded
+        assert produce_av_clipboard_data(chords) == av
+        assert parse_av_clipboard_chords(TestNoteArray.NOTE_COPY).to_objects() == \
+            parse_av_clipboard_data(TestNoteArray.NOTE_COPY).objects
+
+    def test_shared_cell_order(self):
+        copy = RowCopy(objects=[
+            Mine(0, RowPosition(0)), Tap(0, RowPosition(0)), Lift(0, RowPosition(0)), Tap(1, RowPosition(0)),
+            Tap(2, RowPosition(12)), Mine(2, RowPosition(12)),
+        ])
+        av = produce_av_clipboard_data(copy)
+        chords = parse_av_clipboard_chords(av)
+        assert chords == copy.to_chord_copy()
+        assert RowCopy.from_chord_copy(chords) == copy
+        assert produce_av_clipboard_data(chords) == av
+
+    def test_rejected(self):
+        with pytest.raises(ValueError):
+            parse_av_clipboard_chords(TestNoteArray.TIME_COPY)
+        with pytest.raises(ValueError):
+            produce_av_clipboard_data(self.COPY.to_chord_copy(), validate=True)
+
+
+class TestCli:
+    LINES = [
+        TestNoteArray.NOTE_COPY, '', 'not a copy', TestNoteArray.TIME_COPY,
+        produce_av_clipboard_data(StructureCopy([BPM(RowPosition(0), 120.0), Label(RowPosition(3), 'a,"b"\n')])),
+        produce_av_clipboard_data(RowCopy([])),
+    ]
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        path = tmp_path / 'copies.txt'
+        path.write_text('\n'.join(self.LINES * 3) + '\n')
+        return path
+
+    @pytest.mark.parametrize('fmt', [cli.JSONL, cli.CSV, cli.COLUMNAR])
+    @pytest.mark.parametrize('chunk_size', [1, 100, cli.DEFAULT_CHUNK_SIZE])
+    def test_round_trip(self, source, tmp_path, fmt, chunk_size):
+        converted, restored = tmp_path / f'copies.{fmt}', tmp_path / 'restored.txt'
+        errors = StringIO()
+        summary = cli.convert_file(str(source), str(converted), cli.EXPORT, fmt, 1, chunk_size, errors=errors)
+        assert (summary.converted, summary.failed) == (12, 3)
+        assert errors.getvalue().splitlines() == [
+            f'{source}:{line}: ValueError: Argument is not AV clipboard data' for line in (3, 9, 15)
+        ]
+
+        summary = cli.convert_file(str(converted), str(restored), cli.IMPORT, fmt, 1, chunk_size)
+        assert (summary.converted, summary.failed) == (12, 0)
+        assert restored.read_text().splitlines() == [line for line in self.LINES * 3 if line.startswith('Arrow')]
+
+    def test_unknown_note_kind(self, tmp_path):
+        source, converted = tmp_path / 'copies.txt', tmp_path / 'copies.jsonl'
+        unknown_kind = 'ArrowVortex:notes:' + base85.encode_dwords_to_base85(bytes.fromhex('0001810C0C09'))
+        source.write_text(f'{TestNoteArray.NOTE_COPY}\n{unknown_kind}\n')
+        errors = StringIO()
+        summary = cli.convert_file(str(source), str(converted), cli.EXPORT, cli.JSONL, 1, errors=errors)
+        assert (summary.converted, summary.failed) == (1, 1)
+        assert errors.getvalue() == f'{source}:2: ValueError: Unknown note kind 9\n'
+
+    def test_main(self, source, tmp_path):
+        converted, errors = tmp_path / 'copies.csv', tmp_path / 'errors.txt'
+        assert cli.main(['export', str(source), str(converted), '--workers', '2', '--quiet',
+                         '--errors', str(errors)]) == 1
+        assert converted.read_text().startswith(','.join(cli.CSV_HEADER) + '\n1,row,')
+        assert len(errors.read_text().splitlines()) == 3
+
+        restored = tmp_path / 'restored.txt'
+        assert cli.main(['import', str(converted), str(restored), '--workers', '2', '--quiet']) == 0
+        assert len(restored.read_text().splitlines()) == 12
@@ -0,0 +1,172 @@
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Iterable, List
+
+from attr import attrs
+
+from av_clipboard_lib.av_objects import BPM, Delay, Stop, Warp
+from av_clipboard_lib.clipboard_data import RowCopy, StructureCopy, TimeCopy
+from av_clipboard_lib.note_array import NoteArray
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+ROWS_PER_BEAT = 48
+
+
+@attrs(auto_attribs=True, slots=True)
+class TimingMap:
+    """Piecewise linear mapping between rows and seconds, built from BPM, Stop, Delay and Warp segments.
+
+    `rows[i]` is the i-th segment boundary, a note on it is played at `times[i]`, which includes
+    the delays of that row. The stops of that row follow, lasting `stops[i]`, after which every
+    row up to the next boundary takes `rates[i]` seconds (zero inside warps).
+
+    Negative BPMs, stops or delays make time go back, seconds are looked up in `peaks[i]`, the latest
+    time reached up to boundary i, so rows played before an earlier moment again are skipped like a warp.
+    """
+    rows: array
+    times: array
+    stops: array
+    rates: array
+    peaks: array
+
+    @classmethod
+    def from_structures(cls, structures: Iterable):
+        """Build the map from the timing segments in `structures`, other structures are ignored."""
+        bpms = {}
+        stops = defaultdict(float)
+        delays = defaultdict(float)
+        warps = []
+        for structure in structures:
+            row = structure.position.row
+            if isinstance(structure, BPM):
+                bpms[row] = structure.bpm
+            elif isinstance(structure, Stop):
+                stops[row] += structure.time
+            elif isinstance(structure, Delay):
+                delays[row] += structure.time
+            elif isinstance(structure, Warp) and structure.skipped_rows:
+                warps.append((row, row + structure.skipped_rows))
+
+        if not bpms:
+            raise ValueError('Timing needs at least one BPM')
+
+        boundaries = sorted({0, *bpms, *stops, *delays, *(row for warp in warps for row in warp)})
+        bpm_rows = sorted(bpms)
+        warps.sort()
+
+        timing = cls(array('d'), array('d'), array('d'), array('d'), array('d'))
+        time = 0.0
+        peak = float('-inf')
+        bpm_index = warp_index = 0
+        warp_end = 0
+        for index, row in enumerate(boundaries):
+            if index:
+                time += timing.stops[-1] + (row - boundaries[index - 1]) * timing.rates[-1]
+            time += delays.get(row, 0.0)
+            peak = max(peak, time)
+
+            while bpm_index + 1 < len(bpm_rows) and bpm_rows[bpm_index + 1] <= row:
+                bpm_index += 1
+            while warp_index < len(warps) and warps[warp_index][0] <= row:
+                warp_end = max(warp_end, warps[warp_index][1])
+                warp_index += 1
+            in_warp = row < warp_end
+
+            timing.rows.append(row)
+            timing.times.append(time)
+            timing.peaks.append(peak)
+            timing.stops.append(stops.get(row, 0.0))
+            timing.rates.append(0.0 if in_warp else 60 / (bpms[bpm_rows[bpm_index]] * ROWS_PER_BEAT))
+
+        return timing
+
+    @classmethod
+    def from_structure_copy(cls, copy: StructureCopy):
+        return cls.from_structures(copy.objects)
+
+    def row_to_seconds(self, row: float) -> float:
+        index = max(bisect_right(self.rows, row) - 1, 0)
+        if row == self.rows[index]:
+            return self.times[index]
+        return self.times[index] + self.stops[index] + (row - self.rows[index]) * self.rates[index]
+
+    def seconds_to_row(self, seconds: float) -> float:
+        index = max(bisect_right(self.peaks, seconds) - 1, 0)
+        start = self.times[index] + self.stops[index]
+        if seconds <= start and seconds >= self.times[index]:
+            return self.rows[index]
+
+        rate = self.rates[index]
+        if index + 1 == len(self.rows):
+            return self.rows[index] + (rate > 0 and (seconds - start) / rate)
+        if rate <= 0:
+            return self.rows[index + 1]
+        return min(self.rows[index] + (seconds - start) / rate, self.rows[index + 1])
+
+    def rows_to_seconds(self, rows) -> List[float]:
+        """Bulk `row_to_seconds`, vectorized when NumPy is available."""
+        if numpy is None:
+            return [*map(self.row_to_seconds, rows)]
+
+        rows = numpy.asarray(rows, dtype=numpy.float64)
+        boundaries = numpy.frombuffer(self.rows)
+        index = numpy.maximum(numpy.searchsorted(boundaries, rows, side='right') - 1, 0)
+
+        times = numpy.frombuffer(self.times)[index]
+        start = times + numpy.frombuffer(self.stops)[index]
+        seconds = start + (rows - boundaries[index]) * numpy.frombuffer(self.rates)[index]
+        return numpy.where(rows == boundaries[index], times, seconds).tolist()
+
+    def seconds_to_rows(self, seconds) -> List[float]:
+        """Bulk `seconds_to_row`, vectorized when NumPy is available."""
+        if numpy is None:
+            return [*map(self.seconds_to_row, seconds)]
+
+        seconds = numpy.asarray(seconds, dtype=numpy.float64)
+        boundaries = numpy.frombuffer(self.rows)
+        times = numpy.frombuffer(self.times)
+        rates = numpy.frombuffer(self.rates)
+        index = numpy.maximum(numpy.searchsorted(numpy.frombuffer(self.peaks), seconds, side='right') - 1, 0)
+
+        start = times[index] + numpy.frombuffer(self.stops)[index]
+        rate = rates[index]
+        next_row = numpy.append(boundaries[1:], numpy.inf)[index]
+        stalled_row = numpy.append(boundaries[1:], boundaries[-1])[index]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rows = numpy.where(rate > 0, boundaries[index] + (seconds - start) / rate, stalled_row)
+        rows = numpy.minimum(rows, next_row)
+        rows = numpy.where((seconds <= start) & (seconds >= times[index]), boundaries[index], rows)
+        return rows.tolist()
+
+    def to_time_copy(self, copy: RowCopy) -> TimeCopy:
+        """Convert every note of a row-based `copy` to seconds in one pass."""
+        notes = copy.to_note_array()
+        converted = NoteArray(
+            True,
+            notes.columns,
+            notes.kinds,
+            array('d', self.rows_to_seconds(notes.starts)),
+            array('d', self.rows_to_seconds(notes.ends)),
+        )
+        return TimeCopy.from_note_array(converted)
+
+    def to_row_copy(self, copy: TimeCopy, quantization: int = 1) -> RowCopy:
+        """Convert every note of a time-based `copy` to rows, snapped to multiples of `quantization`."""
+        notes = copy.to_note_array()
+
+        def quantize(rows):
+            return array('Q', (int(round(row / quantization)) * quantization for row in rows))
+
+        converted = NoteArray(
+            False,
+            notes.columns,
+            notes.kinds,
+            quantize(self.seconds_to_rows(notes.starts)),
+            quantize(self.seconds_to_rows(notes.ends)),
+        )
+        return RowCopy.from_note_array(converted)
@@ -0,0 +1,79 @@
+"""Bulk operations over the position and column arrays of `NoteArray` and `StructureArray`.
+
+Results match applying the same operation to each note or structure one by one:
+scaled rows are rounded like `round` does, half to even.
+"""
+from array import array
+from typing import Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Below this many values the plain Python loop is faster than going through NumPy.
+_NUMPY_THRESHOLD = 64
+
+_UNSIGNED_DTYPES = {'B': 'u1', 'I': 'u4', 'Q': 'u8'}
+
+
+def _typecode(values) -> str:
+    # Memory mapped columns are memoryviews, they have a format instead.
+    return getattr(values, 'typecode', None) or values.format
+
+
+def affine_positions(values, factor: float = 1, offset=0) -> array:
+    """Return a new array of `values * factor + offset`, the type of `values` is kept.
+
+    Rows are rounded to the nearest integer after scaling, ValueError is raised if any would become negative.
+    """
+    typecode = _typecode(values)
+    if numpy is not None and len(values) >= _NUMPY_THRESHOLD:
+        return _affine_positions_numpy(values, typecode, factor, offset)
+    return _affine_positions_python(values, typecode, factor, offset)
+
+
+def _affine_positions_python(values, typecode: str, factor: float, offset) -> array:
+    if typecode == 'd':
+        return array('d', [value * factor + offset for value in values])
+
+    if factor == 1:
+        result = [value + offset for value in values]
+    else:
+        result = [round(value * factor) + offset for value in values]
+    if result and min(result) < 0:
+        raise ValueError('Rows cannot be negative')
+    return array(typecode, result)
+
+
+def _affine_positions_numpy(values, typecode: str, factor: float, offset) -> array:
+    result = array(typecode)
+    if typecode == 'd':
+        result.frombytes((numpy.frombuffer(values, dtype=numpy.float64) * factor + offset).tobytes())
+        return result
+
+    dtype = _UNSIGNED_DTYPES[typecode]
+    rows = numpy.frombuffer(values, dtype=dtype).astype(numpy.int64)
+    if factor != 1:
+        rows = numpy.rint(rows * factor).astype(numpy.int64)
+    rows += offset
+    if rows.min() < 0:
+        raise ValueError('Rows cannot be negative')
+    result.frombytes(rows.astype(dtype).tobytes())
+    return result
+
+
+def remap_columns(columns, mapping: Sequence[int]) -> array:
+    """Return a new array with each column `c` of `columns` replaced with `mapping[c]`."""
+    if len(columns) and max(columns) >= len(mapping):
+        raise ValueError(f'Column {max(columns)} has no mapping')
+
+    table = (bytes(mapping) + bytes(256))[:256]
+    result = array('B')
+    result.frombytes(bytes(columns).translate(table))
+    return result
+
+
+def mirror_columns(columns, column_count: int) -> array:
+    """Return a new array with columns flipped left to right, out of `column_count` columns."""
+    return remap_columns(columns, range(column_count - 1, -1, -1))
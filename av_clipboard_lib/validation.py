@@ -0,0 +1,96 @@
+from typing import Any, Iterable, List, Optional, Tuple, Union
+
+from attr import attrs
+
+from av_clipboard_lib.av_objects import LongNote, NoteType
+from av_clipboard_lib.note_array import NoteArray, _LONG_KINDS
+
+# Columns are stored in 7 bits on the wire, the high bit flags notes that are not taps.
+MAX_COLUMNS = 0x80
+
+DUPLICATE = 'duplicate'
+OVERLAPPING_LONG_NOTES = 'overlapping long notes'
+INSIDE_LONG_NOTE = 'inside long note'
+COLUMN_OUT_OF_RANGE = 'column out of range'
+
+
+@attrs(auto_attribs=True, slots=True, frozen=True)
+class NoteIssue:
+    """A `problem` with the note at `index` of a copy, `other` is the index of the note it collides with."""
+    problem: str
+    index: int
+    other: Optional[int] = None
+
+
+# column, start, end, whether the note is long; positions are numbers for note arrays
+Span = Tuple[int, Any, Any, bool]
+NoteCollection = Union[NoteArray, Iterable[NoteType]]
+
+
+def _spans_of_objects(objects: Iterable[NoteType]) -> List[Span]:
+    spans = []
+    for note in objects:
+        if isinstance(note, LongNote):
+            spans.append((note.column, note.start_position, note.end_position, True))
+        else:
+            spans.append((note.column, note.position, note.position, False))
+    return spans
+
+
+def _spans_of_array(notes: NoteArray) -> List[Span]:
+    return [
+        (column, start, end, kind in _LONG_KINDS)
+        for column, kind, start, end in zip(notes.columns, notes.kinds, notes.starts, notes.ends)
+    ]
+
+
+def find_note_issues(notes: NoteCollection, column_count: int = MAX_COLUMNS) -> List[NoteIssue]:
+    """Find the notes of `notes` that AV would reject or report, sorted by index.
+
+    `notes` is a `NoteArray`, a list of notes or a row or time copy. Notes are swept column by column
+    in order of position, keeping the furthest reaching long note so far, so this takes O(n log n).
+    A long note covers its end as well, a note placed on the end of a hold is inside it.
+    """
+    if isinstance(notes, NoteArray):
+        spans = _spans_of_array(notes)
+    else:
+        spans = _spans_of_objects(getattr(notes, 'objects', notes))
+
+    issues = []
+    # Ties keep their index order, so the note listed first is the one the others collide with.
+    order = sorted(range(len(spans)), key=lambda index: spans[index][:2])
+
+    current_column = reach = None
+    previous = reaching = None
+    for index in order:
+        column, start, end, is_long = spans[index]
+        if not 0 <= column < column_count:
+            issues.append(NoteIssue(COLUMN_OUT_OF_RANGE, index))
+
+        if column != current_column:
+            current_column, previous, reaching = column, None, None
+        elif spans[previous][1] == start:
+            issues.append(NoteIssue(DUPLICATE, index, previous))
+        elif reaching is not None and start <= reach:
+            problem = is_long and OVERLAPPING_LONG_NOTES or INSIDE_LONG_NOTE
+            issues.append(NoteIssue(problem, index, reaching))
+
+        if is_long and (reaching is None or end > reach):
+            reach, reaching = end, index
+        previous = index
+
+    issues.sort(key=lambda issue: issue.index)
+    return issues
+
+
+def check_notes(notes: NoteCollection, column_count: int = MAX_COLUMNS):
+    """Raise ValueError describing every issue `find_note_issues` finds in `notes`."""
+    issues = find_note_issues(notes, column_count)
+    if issues:
+        details = ', '.join(
+            issue.other is None and f'note {issue.index}: {issue.problem}'
+            or f'note {issue.index}: {issue.problem} (note {issue.other})'
+            for issue in issues
+        )
+        raise ValueError(f'Invalid notes: {details}')
+
@@ -1,5 +1,5 @@
 from io import BytesIO
-from itertools import count
+from typing import Tuple
 
 
 def decode_next_varint(stream: BytesIO) -> int:
@@ -8,18 +8,31 @@ def decode_next_varint(stream: BytesIO) -> int:
     >>> decode_next_varint(BytesIO(bytes.fromhex("BDC703F00DBAADF00DBAAD")))
     58301
     """
+    with stream.getbuffer() as view:
+        result, offset = decode_varint_from(view, stream.tell())
+    stream.seek(offset)
 
+    return result
+
+
+def decode_varint_from(buffer, offset: int) -> Tuple[int, int]:
+    """Read the var int at `offset` in `buffer`, return it and the offset right after it.
+
+    >>> decode_varint_from(bytes.fromhex("00BDC703F00D"), 1)
+    (58301, 4)
+    """
     result = 0
+    shift = 0
 
-    for segment_num in count():
-        next_byte = int.from_bytes(stream.read(1), 'big')
-        segment = next_byte & 0x7F
-        result += segment << (7 * segment_num)
+    while True:
+        next_byte = buffer[offset]
+        offset += 1
+        result |= (next_byte & 0x7F) << shift
 
         if not next_byte & 0x80:
-            break
+            return result, offset
 
-    return result
+        shift += 7
 
 
 def encode_varint(number: int) -> bytes:
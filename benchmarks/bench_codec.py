@@ -0,0 +1,221 @@
+"""Throughput benchmarks for the clipboard codec.
+
+Run ``python benchmarks/bench_codec.py`` from the repository root. Results are written as JSON;
+pass ``--compare baseline.json`` to flag regressions against an earlier run.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import av_clipboard_lib as av  # noqa: E402
+from av_clipboard_lib.av_objects import LongNote  # noqa: E402
+from av_clipboard_lib.base85 import decode_dwords_from_base85, encode_dwords_to_base85  # noqa: E402
+from av_clipboard_lib.clipboard_data import RowCopy, StructureCopy, TimeCopy  # noqa: E402
+from av_clipboard_lib.varint import decode_next_varint, encode_varint  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+
+
+def generate_row_copy(size: int, rng: random.Random, hold_ratio: float = 0.1) -> RowCopy:
+    objects = []
+    row = 0
+    for _ in range(size):
+        row += rng.choice((0, 3, 4, 6, 12, 24, 48))
+        column = rng.randrange(8)
+        if rng.random() < hold_ratio:
+            kind = rng.choice((av.Hold, av.Roll))
+            objects.append(kind(column, av.RowPosition(row), av.RowPosition(row + rng.choice((12, 48, 192)))))
+        else:
+            kind = rng.choice((av.Tap, av.Tap, av.Tap, av.Mine, av.Lift, av.Fake))
+            objects.append(kind(column, av.RowPosition(row)))
+    return RowCopy(objects)
+
+
+def generate_hold_copy(size: int, rng: random.Random) -> RowCopy:
+    return generate_row_copy(size, rng, hold_ratio=0.9)
+
+
+def generate_time_copy(size: int, rng: random.Random) -> TimeCopy:
+    row_copy = generate_row_copy(size, rng)
+    objects = []
+    for note in row_copy.objects:
+        if isinstance(note, LongNote):
+            objects.append(note.__class__(
+                note.column,
+                av.TimePosition(note.start_position.row / 96),
+                av.TimePosition(note.end_position.row / 96),
+            ))
+        else:
+            objects.append(note.__class__(note.column, av.TimePosition(note.position.row / 96)))
+    return TimeCopy(objects)
+
+
+def _random_structure(row: int, rng: random.Random, label_ratio: float):
+    if rng.random() < label_ratio:
+        return av.Label(av.RowPosition(row), 'label %d' % rng.randrange(10 ** 6))
+
+    return rng.choice((
+        lambda: av.BPM(av.RowPosition(row), rng.uniform(60, 300)),
+        lambda: av.Stop(av.RowPosition(row), rng.uniform(0, 2)),
+        lambda: av.Delay(av.RowPosition(row), rng.uniform(0, 2)),
+        lambda: av.Warp(av.RowPosition(row), rng.randrange(1, 192)),
+        lambda: av.TimeSignature(av.RowPosition(row), rng.randrange(1, 16), rng.choice((4, 8, 16))),
+        lambda: av.Ticks(av.RowPosition(row), rng.randrange(1, 64)),
+        lambda: av.Combo(av.RowPosition(row), rng.randrange(1, 8), rng.randrange(1, 8)),
+        lambda: av.Speed(av.RowPosition(row), rng.uniform(0.5, 2), rng.uniform(0, 4), rng.random() < 0.5),
+        lambda: av.Scroll(av.RowPosition(row), rng.uniform(0.5, 2)),
+        lambda: av.FakeSegment(av.RowPosition(row), rng.randrange(1, 192)),
+    ))()
+
+
+def generate_structure_copy(size: int, rng: random.Random, label_ratio: float = 0.05) -> StructureCopy:
+    return StructureCopy([_random_structure(index * 12, rng, label_ratio) for index in range(size)])
+
+
+def generate_label_copy(size: int, rng: random.Random) -> StructureCopy:
+    return generate_structure_copy(size, rng, label_ratio=0.9)
+
+
+GENERATORS = {
+    'row': generate_row_copy,
+    'row-holds': generate_hold_copy,
+    'time': generate_time_copy,
+    'structure': generate_structure_copy,
+    'structure-labels': generate_label_copy,
+}
+
+
+def _measure(func, repeat: int, setup=None) -> float:
+    """Best time of `repeat` calls of `func`, passed the result of `setup` if given, which is not timed."""
+    best = float('inf')
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_case(kind: str, size: int, repeat: int, seed: int) -> dict:
+    copy = GENERATORS[kind](size, random.Random(seed))
+    text = av.produce_av_clipboard_data(copy)
+    payload = copy.encoded
+    base85_text = text[18:]
+    varints = None
+    if isinstance(copy, RowCopy):
+        varints = [note.order_tuple[0].row for note in copy.objects]
+
+    stages = {
+        'parse': (lambda: av.parse_av_clipboard_data(text), len(text)),
+        # Copies and their notes keep what they encoded, so a cold produce needs a freshly parsed copy on every run.
+        'produce': (av.produce_av_clipboard_data, len(text), lambda: av.parse_av_clipboard_data(text)),
+        'produce_warm': (lambda: av.produce_av_clipboard_data(copy), len(text)),
+        'base85_decode': (lambda: decode_dwords_from_base85(base85_text), len(base85_text)),
+        'base85_encode': (lambda: encode_dwords_to_base85(payload), len(payload)),
+    }
+    if not isinstance(copy, StructureCopy):
+        edited = copy.objects[len(copy.objects) // 2]
+
+        def produce_edited():
+            edited.column ^= 1
+            av.produce_av_clipboard_data(copy)
+
+        stages['produce_edited'] = (produce_edited, len(text))
+    if varints is not None:
+        encoded_varints = b''.join(map(encode_varint, varints))
+
+        def decode_varints():
+            stream = BytesIO(encoded_varints)
+            for _ in varints:
+                decode_next_varint(stream)
+
+        stages['varint_encode'] = (lambda: [*map(encode_varint, varints)], len(encoded_varints))
+        stages['varint_decode'] = (decode_varints, len(encoded_varints))
+
+    results = {}
+    for stage, (func, byte_count, *setup) in stages.items():
+        seconds = _measure(func, repeat, *setup)
+        results[stage] = {
+            'seconds': seconds,
+            'objects_per_second': size / seconds if seconds else None,
+            'bytes_per_second': byte_count / seconds if seconds else None,
+        }
+
+    return {'kind': kind, 'size': size, 'bytes': len(text), 'stages': results}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return the stages whose objects/s dropped by more than `threshold` against `baseline`."""
+    previous = {(case['kind'], case['size']): case for case in baseline['cases']}
+
+    regressions = []
+    for case in results['cases']:
+        old_case = previous.get((case['kind'], case['size']))
+        if old_case is None:
+            continue
+        for stage, measurement in case['stages'].items():
+            old = old_case['stages'].get(stage)
+            if not old or not old['objects_per_second'] or not measurement['objects_per_second']:
+                continue
+            ratio = measurement['objects_per_second'] / old['objects_per_second']
+            if ratio < 1 - threshold:
+                regressions.append({
+                    'kind': case['kind'],
+                    'size': case['size'],
+                    'stage': stage,
+                    'ratio': ratio,
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--kinds', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7787)
+    parser.add_argument('--output', type=Path, help='write results as JSON here instead of stdout')
+    parser.add_argument('--compare', type=Path, help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='tolerated slowdown ratio, default 0.1')
+    args = parser.parse_args(argv)
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': av.base85.numpy is not None,
+        'cases': [],
+    }
+    for kind in args.kinds:
+        for size in args.sizes:
+            case = run_case(kind, size, args.repeat, args.seed)
+            results['cases'].append(case)
+            print('%-16s %8d  parse %12.0f obj/s  produce %12.0f obj/s' % (
+                kind, size, case['stages']['parse']['objects_per_second'],
+                case['stages']['produce']['objects_per_second'],
+            ), file=sys.stderr)
+
+    exit_code = 0
+    if args.compare:
+        results['regressions'] = compare(results, json.loads(args.compare.read_text()), args.threshold)
+        for regression in results['regressions']:
+            print('REGRESSION %(kind)s/%(size)d %(stage)s at %(ratio).2fx of baseline' % regression,
+                  file=sys.stderr)
+        exit_code = results['regressions'] and 1 or 0
+
+    dump = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(dump)
+    else:
+        print(dump)
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Memory footprint of parsed copies, measured with tracemalloc.
+
+Run ``python benchmarks/bench_memory.py`` from the repository root.
+"""
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import av_clipboard_lib as av  # noqa: E402
+from bench_codec import GENERATORS  # noqa: E402
+
+
+def measure(kind: str, size: int, seed: int) -> dict:
+    text = av.produce_av_clipboard_data(GENERATORS[kind](size, random.Random(seed)))
+
+    tracemalloc.start()
+    copy = av.parse_av_clipboard_data(text)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'kind': kind,
+        'size': len(copy.objects),
+        'retained_bytes': retained,
+        'peak_bytes': peak,
+        'bytes_per_object': retained / len(copy.objects),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200000])
+    parser.add_argument('--kinds', nargs='+', choices=sorted(GENERATORS), default=['row', 'time', 'structure'])
+    parser.add_argument('--seed', type=int, default=7787)
+    args = parser.parse_args(argv)
+
+    results = [measure(kind, size, args.seed) for kind in args.kinds for size in args.sizes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,4 +14,5 @@ with open("README.md", encoding='utf-8') as in_:
         description='Small ArrowVortex clipboard processing library',
         python_requires='>=3.6',
         install_requires=["attrs"],
+        extras_require={"numpy": ["numpy"]},
     )